@@ -0,0 +1,95 @@
+"""
+Database settings of the site, chosen by the ``DB_PROFILE`` config.
+
+``sqlite``, the default, keeps the site in one file tuned for concurrent
+requests. Write-ahead logging lets readers go on while a vote is written,
+transactions take the write lock when they begin and the busy timeout
+makes them wait for it instead of failing with "database is locked", and
+connections are kept between requests.
+
+``postgresql`` reads the usual ``DB_*`` values. Each worker keeps its
+connections open; to share a pool between many workers put PgBouncer in
+front and set ``DB_POOLER = True``.
+
+``DB_REPLICA_NAME`` (SQLite) or ``DB_REPLICA_HOST`` (PostgreSQL) adds a
+read-only replica of the same profile.
+"""
+from decouple import config
+from django.core.exceptions import ImproperlyConfigured
+
+
+def sqlite(base_dir):
+    """Return the settings of a tuned SQLite database file."""
+    return {
+        'ENGINE': 'mysite.sqlite_backend',
+        'NAME': config('DB_NAME', default=str(base_dir / 'db.sqlite3')),
+        'OPTIONS': {
+            # seconds a transaction waits for the write lock
+            'timeout': config('DB_BUSY_TIMEOUT', default=20, cast=float),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # run on every new connection
+        'PRAGMAS': {
+            'journal_mode': config('DB_JOURNAL_MODE', default='wal'),
+            # with WAL a commit is still atomic, only the last ones may be
+            # lost by a power cut
+            'synchronous': config('DB_SYNCHRONOUS', default='normal'),
+            'mmap_size': config('DB_MMAP_SIZE', default=256 * 1024 * 1024,
+                                cast=int),
+        },
+    }
+
+
+def postgresql(base_dir):
+    """Return the settings of a PostgreSQL database."""
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config('DB_NAME', default='ku_polls'),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # a transaction pooler hands each transaction its own server
+        # connection, where a named cursor of the previous one is gone
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_POOLER', default=False,
+                                              cast=bool),
+    }
+
+
+PROFILES = {'sqlite': sqlite, 'postgresql': postgresql}
+
+
+def database(base_dir):
+    """Return the ``DATABASES['default']`` of the ``DB_PROFILE`` config."""
+    profile = config('DB_PROFILE', default='sqlite')
+    if profile not in PROFILES:
+        raise ImproperlyConfigured(
+            f"DB_PROFILE must be one of {', '.join(PROFILES)}, "
+            f"not {profile!r}")
+    return PROFILES[profile](base_dir)
+
+
+def replica(base_dir):
+    """Return the settings of the read-only replica, None without one."""
+    profile = config('DB_PROFILE', default='sqlite')
+    if profile == 'postgresql':
+        host = config('DB_REPLICA_HOST', default='')
+        if not host:
+            return None
+        database = postgresql(base_dir)
+        database.update(HOST=host, PORT=config('DB_REPLICA_PORT',
+                                               default=database['PORT']))
+    else:
+        name = config('DB_REPLICA_NAME', default='')
+        if not name:
+            return None
+        database = sqlite(base_dir)
+        database['NAME'] = name
+        database['PRAGMAS'] = {**database['PRAGMAS'], 'query_only': 1}
+    # tests read the replica from the test database of the primary
+    database['TEST'] = {'MIRROR': 'default'}
+    return database
@@ -0,0 +1,87 @@
+"""
+Password hashers of the site, with a cost tuned by settings.
+
+Each hasher keeps the algorithm name of the Django hasher it extends, so
+hashes made by either are checked by both. A password hashed with another
+algorithm or cost than the preferred hasher is rehashed at the next login.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with ``PASSWORD_PBKDF2_ITERATIONS`` iterations."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS',
+                       hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """Scrypt with a work factor of ``PASSWORD_SCRYPT_WORK_FACTOR``.
+
+    A hash is checked with at most twice the memory of the configured
+    cost, so the cost can be halved without locking anyone out, but an
+    imported hash with a larger one fails instead of taking the memory
+    it asks for at every login attempt.
+    """
+
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR',
+                       hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def maxmem(self):
+        return 2 * memory(self.work_factor, self.block_size,
+                          self.parallelism)
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        if (decoded['parallelism'] > self.parallelism
+                or memory(decoded['work_factor'], decoded['block_size'],
+                          decoded['parallelism']) > self.maxmem):
+            return False
+        return super().verify(password, encoded)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """
+    Argon2id with ``PASSWORD_ARGON2_TIME_COST`` passes over
+    ``PASSWORD_ARGON2_MEMORY_COST`` KiB, needs argon2-cffi.
+    """
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST',
+                       hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST',
+                       hashers.Argon2PasswordHasher.memory_cost)
+
+
+def memory(n, r, p):
+    """Return the bytes OpenSSL allocates for a scrypt hash."""
+    return 128 * r * (n + p + 2)
+
+
+PROFILES = {
+    'scrypt': 'mysite.hashers.ScryptPasswordHasher',
+    'argon2': 'mysite.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'mysite.hashers.PBKDF2PasswordHasher',
+}
+
+
+def password_hashers(preferred):
+    """Return the ``PASSWORD_HASHERS`` that hash new passwords with one.
+
+    The other hashers follow, so older passwords are still checked.
+    """
+    return [PROFILES[preferred]] + [
+        path for name, path in PROFILES.items() if name != preferred] + [
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    ]
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Choices, config
+from . import db_profiles
+from .hashers import password_hashers
 import os.path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -98,14 +100,106 @@ WSGI_APPLICATION = "mysite.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
+# DB_PROFILE chooses a profile of mysite/db_profiles.py
 
 DATABASES = {
+    "default": db_profiles.database(BASE_DIR),
+}
+DATABASE_ROUTERS = ["polls.routers.PrimaryReplicaRouter"]
+
+# the index, results and API pages read the replica, a voter reads the
+# primary for REPLICA_STICKY_SECONDS after voting
+replica_database = db_profiles.replica(BASE_DIR)
+if replica_database is not None:
+    DATABASES["replica"] = replica_database
+POLLS_REPLICA_DATABASE = "replica" if replica_database is not None else None
+POLLS_REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=10,
+                                      cast=int)
+
+# Sessions
+# "cached_db" reads sessions from the cache and writes them through to the
+# database, "signed_cookies" keeps them in the cookie without any query,
+# "db" reads the database on every request
+SESSION_ENGINE = "django.contrib.sessions.backends." + config(
+    "SESSION_BACKEND", default="cached_db",
+    cast=Choices(["db", "cached_db", "signed_cookies", "cache"]))
+
+# messages travel in a cookie, never in the session
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# LocMem is private to each process, use a shared backend such as
+# django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.redis.RedisCache with several workers.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": config(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="ku-polls"),
     }
 }
 
+# Seconds a stale results tally may be served while it is being rebuilt
+POLLS_RESULTS_MAX_STALENESS = config("POLLS_RESULTS_MAX_STALENESS",
+                                     default=2, cast=float)
+
+# "sync" writes each vote in the request, "queued" appends it to the
+# write-behind queue drained by `manage.py process_votes`
+POLLS_VOTE_INGEST = config("VOTE_INGEST", default="sync")
+POLLS_VOTE_QUEUE_PATH = config("VOTE_QUEUE_PATH",
+                               default=str(BASE_DIR / "vote_queue.sqlite3"))
+
+# route the native async polls views, for the ASGI server
+POLLS_ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
+
+# seconds before a live results stream ends and the browser reconnects,
+# Django 4.2 does not end the stream of a client that went away
+POLLS_STREAM_MAX_AGE = config("STREAM_MAX_AGE", default=300, cast=float)
+
+# refresh the question statistics after each vote, instead of only by
+# `manage.py refresh_question_stats`
+POLLS_STATS_ON_VOTE = config("STATS_ON_VOTE", default=False, cast=bool)
+
+# `manage.py archive_polls` freezes a poll this many days after its end
+# and moves ("move"), deletes ("delete") or keeps ("keep") its votes
+POLLS_ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", default=30, cast=int)
+POLLS_VOTE_RETENTION = config("VOTE_RETENTION", default="move")
+
+# proxies in front of the site that append to X-Forwarded-For, the client
+# IP address is read that many hops from the right; 0 trusts no header
+POLLS_TRUSTED_PROXIES = config("TRUSTED_PROXIES", default=0, cast=int)
+
+# token bucket limits of the vote and signup views, "capacity/seconds" per
+# logged in user and per IP address, empty to turn one off; one IP may be
+# the NAT of a whole campus
+POLLS_RATE_LIMITS = {
+    "vote": {
+        "user": config("VOTE_RATE_USER", default="10/60"),
+        "ip": config("VOTE_RATE_IP", default="600/60"),
+    },
+    "signup": {
+        "ip": config("SIGNUP_RATE_IP", default="20/600"),
+    },
+}
+
+# Password hashing
+# PASSWORD_HASHER hashes new passwords, and older ones at the next login:
+# scrypt, argon2 (needs `pip install argon2-cffi`) or pbkdf2
+PASSWORD_HASHERS = password_hashers(config(
+    "PASSWORD_HASHER", default="scrypt",
+    cast=Choices(["scrypt", "argon2", "pbkdf2"])))
+PASSWORD_SCRYPT_WORK_FACTOR = config("PASSWORD_SCRYPT_WORK_FACTOR",
+                                     default=2 ** 14, cast=int)
+PASSWORD_ARGON2_TIME_COST = config("PASSWORD_ARGON2_TIME_COST", default=2,
+                                   cast=int)
+PASSWORD_ARGON2_MEMORY_COST = config("PASSWORD_ARGON2_MEMORY_COST",
+                                     default=102400, cast=int)
+PASSWORD_PBKDF2_ITERATIONS = config("PASSWORD_PBKDF2_ITERATIONS",
+                                    default=600000, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,40 @@
+"""
+The SQLite backend of Django with two settings of its own.
+
+``OPTIONS['transaction_mode']`` starts every ``atomic()`` block with
+``BEGIN IMMEDIATE`` (or ``EXCLUSIVE``). A plain ``BEGIN`` takes the write
+lock only at the first write, and a transaction that read first then fails
+at once with "database is locked" when another one writes meanwhile,
+without waiting for the busy timeout.
+
+``PRAGMAS`` are run on every new connection, for example
+``{'journal_mode': 'wal'}``.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite connection with a transaction mode and PRAGMAs."""
+
+    transaction_mode = None
+
+    def get_connection_params(self):
+        """Take the transaction mode out of the sqlite3.connect() options."""
+        params = super().get_connection_params()
+        mode = params.pop('transaction_mode', None)
+        self.transaction_mode = mode.upper() if mode else None
+        return params
+
+    def get_new_connection(self, conn_params):
+        """Open the connection and run the PRAGMAs of the settings."""
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        """Start the transaction in the transaction mode of the settings."""
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
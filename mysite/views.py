@@ -2,6 +2,7 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
+from polls.ratelimit import rate_limit
 
 
 def index(request):
@@ -9,6 +10,7 @@ def index(request):
     return redirect('polls:index')
 
 
+@rate_limit('signup', methods=('POST',))
 def signup(request):
     """Register a new user."""
     if request.method == 'POST':
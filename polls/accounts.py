@@ -0,0 +1,92 @@
+"""Bulk provisioning of student accounts from a roster CSV.
+
+A password hash is slow on purpose, so the passwords of a roster are
+hashed by a pool of processes, one per core by default, while the
+accounts are written in batches by the main process.
+"""
+import csv
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+FIELDS = ('username', 'password', 'email', 'first_name', 'last_name')
+
+
+def read_roster(path):
+    """Yield the account fields of every row of a roster CSV.
+
+    The CSV needs a ``username`` column, the other ``FIELDS`` may be
+    left out. An empty password gives an account that cannot log in.
+    """
+    with open(path, newline='', encoding='utf-8') as handle:
+        reader = csv.DictReader(handle)
+        if 'username' not in (reader.fieldnames or ()):
+            raise ValueError(f"{path} has no username column.")
+        for row in reader:
+            if not row['username']:
+                raise ValueError(f"{path}:{reader.line_num}: no username.")
+            yield {field: row.get(field) or '' for field in FIELDS}
+
+
+def _setup_worker():
+    """Set Django up in a worker process started without fork."""
+    django.setup()
+
+
+def hash_passwords(passwords):
+    """Return the hashes of raw passwords, unusable ones for empty ones."""
+    return [make_password(password or None) for password in passwords]
+
+
+class Provisioner:
+    """Create the accounts of a roster, hashing passwords in parallel.
+
+    Use it as a context manager, the worker processes live until it
+    exits.
+    """
+
+    def __init__(self, workers=1, chunk_size=50):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pool = None
+        self.created = 0
+        self.skipped = 0
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(self.workers,
+                                            initializer=_setup_worker)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def hash_all(self, passwords):
+        """Return the hashes of passwords, in the same order."""
+        chunks = [passwords[start:start + self.chunk_size]
+                  for start in range(0, len(passwords), self.chunk_size)]
+        hashed = (self.pool.map(hash_passwords, chunks) if self.pool
+                  else map(hash_passwords, chunks))
+        return [password for chunk in hashed for password in chunk]
+
+    def add(self, rows):
+        """Create the accounts of a batch of rows, skip existing ones."""
+        rows = list({row['username']: row for row in rows}.values())
+        existing = set(User.objects.filter(
+            username__in=[row['username'] for row in rows]
+        ).values_list('username', flat=True))
+        new = [row for row in rows if row['username'] not in existing]
+        hashes = self.hash_all([row['password'] for row in new])
+        User.objects.bulk_create(
+            [User(**{**row, 'password': password})
+             for row, password in zip(new, hashes)],
+            ignore_conflicts=True)
+        # a username taken since the query above is left out silently;
+        # every hash is salted, so only the inserted rows hold one of them
+        created = User.objects.filter(
+            username__in=[row['username'] for row in new],
+            password__in=hashes).count()
+        self.created += created
+        self.skipped += len(rows) - created
@@ -1,6 +1,10 @@
 """Create required question admin features."""
 from django.contrib import admin
-from .models import Question, Choice
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from . import exports
+from .models import Question, Choice, Vote
+from .paginators import EstimatedCountPaginator
 
 
 class ChoiceInline(admin.StackedInline):
@@ -10,6 +14,43 @@ class ChoiceInline(admin.StackedInline):
     extra = 3
 
 
+class StatusListFilter(admin.SimpleListFilter):
+    """Filter questions by poll status, evaluated in the database."""
+
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        """Return the poll statuses to choose from."""
+        return [
+            ('open', 'Open for voting'),
+            ('closed', 'Closed'),
+            ('upcoming', 'Upcoming'),
+        ]
+
+    def queryset(self, request, queryset):
+        """Filter the changelist with the chosen status."""
+        if self.value() in dict(self.lookup_choices):
+            return queryset.status(self.value())
+        return queryset
+
+
+def export_action(kind, output_format):
+    """Make an admin action that downloads one kind of rows as a stream."""
+    def export(modeladmin, request, queryset):
+        stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+        response = StreamingHttpResponse(
+            exports.stream_rows(kind, queryset, output_format),
+            content_type=exports.CONTENT_TYPES[output_format])
+        response.headers['Content-Disposition'] = \
+            f'attachment; filename="{kind}-{stamp}.{output_format}"'
+        return response
+    export.__name__ = f'export_{kind}_{output_format}'
+    export.short_description = \
+        f'Export {kind} of selected questions as {output_format.upper()}'
+    return export
+
+
 class QuestionAdmin(admin.ModelAdmin):
     """Set up for showing information on the admin page."""
 
@@ -17,12 +58,101 @@ class QuestionAdmin(admin.ModelAdmin):
         (None, {'fields': ['question_text']}),
         ('Date information',
          {'fields': ['pub_date'], 'classes': ['collapse']}),
+        ('Performance',
+         {'fields': ['counter_shards'], 'classes': ['collapse']}),
+        ('Retention',
+         {'fields': ['vote_retention', 'retention_days', 'archived_at'],
+          'classes': ['collapse']}),
     ]
+    readonly_fields = ['archived_at']
     inlines = [ChoiceInline]
-    list_display = ('question_text', 'pub_date', 'was_published_recently')
-    list_filter = ['pub_date']
+    list_display = ('question_text', 'pub_date', 'was_published_recently',
+                    'total_votes', 'turnout', 'leading_choice',
+                    'votes_per_hour', 'stats_refreshed_at')
+    # the statistics come from QuestionStats, in the query of the page
+    list_select_related = ['stats__leading_choice']
+    list_filter = [StatusListFilter, 'pub_date']
     search_fields = ['question_text']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [export_action(kind, output_format)
+               for kind in exports.FIELDS
+               for output_format in exports.FORMATS]
+
+    @admin.display(description='Votes', ordering='stats__total_votes',
+                   empty_value='-')
+    def total_votes(self, question):
+        """Return the amount of votes of the question."""
+        stats = getattr(question, 'stats', None)
+        return stats and stats.total_votes
+
+    @admin.display(description='Turnout', empty_value='-')
+    def turnout(self, question):
+        """Return the percentage of active users who voted."""
+        stats = getattr(question, 'stats', None)
+        return stats and f"{stats.turnout}%"
+
+    @admin.display(description='Leading choice', empty_value='-')
+    def leading_choice(self, question):
+        """Return the leading choice and its margin over the next one."""
+        stats = getattr(question, 'stats', None)
+        if stats is None or stats.leading_choice is None:
+            return None
+        return f"{stats.leading_choice.choice_text} (+{stats.margin})"
+
+    @admin.display(description='Votes/hour',
+                   ordering='stats__votes_per_hour', empty_value='-')
+    def votes_per_hour(self, question):
+        """Return the average amount of votes per hour."""
+        stats = getattr(question, 'stats', None)
+        return stats and round(stats.votes_per_hour, 2)
+
+    @admin.display(description='Statistics as of',
+                   ordering='stats__refreshed_at', empty_value='-')
+    def stats_refreshed_at(self, question):
+        """Return when the statistics were computed."""
+        stats = getattr(question, 'stats', None)
+        return stats and stats.refreshed_at
+
+
+class ChoiceAdmin(admin.ModelAdmin):
+    """Choices with their vote counters, the question picked by id."""
+
+    list_display = ('choice_text', 'question', 'votes')
+    list_select_related = ['question']
+    autocomplete_fields = ['question']
+    search_fields = ['choice_text']
+    readonly_fields = ['vote_count']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate every choice with its counter total."""
+        return super().get_queryset(request).with_counters()
+
+    @admin.display(description='Votes', ordering='num_votes')
+    def votes(self, choice):
+        """Return the vote counter of the choice."""
+        return choice.num_votes
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """
+    Votes, newest first, without a select box of every user, question
+    or choice.
+    """
+
+    list_display = ('id', 'user', 'question', 'choice', 'created_at')
+    list_select_related = ['user', 'question', 'choice']
+    raw_id_fields = ['user', 'question', 'choice']
+    readonly_fields = ['created_at', 'updated_at']
+    # exact username, found with the unique index
+    search_fields = ['=user__username']
+    ordering = ['-pk']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Question, QuestionAdmin)
-admin.site.register(Choice)
+admin.site.register(Choice, ChoiceAdmin)
+admin.site.register(Vote, VoteAdmin)
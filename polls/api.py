@@ -0,0 +1,238 @@
+"""Read-only JSON API of poll results and vote timelines.
+
+``full`` payloads carry the question and choice texts with votes and
+percentages. ``?format=compact`` only carries the vote counts, ordered by
+choice id, for dashboards that poll often and already know the choices.
+"""
+import hashlib
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views import generic
+from django.views.decorators.gzip import gzip_page
+from . import results_cache, timeline
+from .models import Choice, Question, Vote
+from .views import ConditionalGetMixin, ReplicaReadMixin
+
+FORMATS = ('full', 'compact')
+
+
+def max_batch():
+    """Return how many questions one batch request may ask for."""
+    return getattr(settings, 'POLLS_API_MAX_BATCH', 100)
+
+
+def load_results(questions, compact=False):
+    """Return the results payload of every question.
+
+    Current tallies of the results cache are used as they are, the counts
+    of all other questions come from one aggregated query of their
+    choices, whatever the amount of questions.
+
+    Args:
+        questions: (id, question_text, last_modified) tuples.
+        compact: only return the vote counts when True.
+
+    Returns:
+        list[dict]: one result per question, in the given order.
+    """
+    ids = [question[0] for question in questions]
+    choices = {
+        pk: [(choice.pk, choice.choice_text, choice.num_votes)
+             for choice in tally]
+        for pk, tally in results_cache.peek_tallies(ids).items()}
+    missing = [pk for pk in ids if pk not in choices]
+    if missing:
+        rows = Choice.objects.filter(question_id__in=missing).with_counters(
+        ).order_by('question_id', 'pk').values_list(
+            'question_id', 'pk', 'choice_text', 'num_votes')
+        for question_id, pk, text, votes in rows:
+            choices.setdefault(question_id, []).append((pk, text, votes))
+    results = []
+    for pk, text, _ in questions:
+        counts = choices.get(pk, [])
+        if compact:
+            results.append({'id': pk, 'counts': [c[2] for c in counts]})
+            continue
+        total = sum(c[2] for c in counts)
+        results.append({
+            'id': pk,
+            'question': text,
+            'total': total,
+            'choices': [{
+                'id': choice_id,
+                'text': choice_text,
+                'votes': votes,
+                'percentage': round(votes * 100 / total, 1) if total else 0.0,
+            } for choice_id, choice_text, votes in counts],
+        })
+    return results
+
+
+class JSONView(generic.View):
+    """View that answers GET with the JSON of ``get_payload()``."""
+
+    def get_payload(self):
+        """Return the JSON serializable body of the response."""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        """Return the payload without whitespace."""
+        return JsonResponse(self.get_payload(),
+                            json_dumps_params={'separators': (',', ':')})
+
+
+@method_decorator(gzip_page, name='dispatch')
+class ResultsAPIView(ReplicaReadMixin, ConditionalGetMixin, JSONView):
+    """Base view of the results API, answers 304 or a gzipped JSON body."""
+
+    def get_question_ids(self):
+        """Return the ids of the questions asked for."""
+        raise NotImplementedError
+
+    def get_format(self):
+        """Return the payload format chosen by the query string."""
+        name = self.request.GET.get('format', 'full')
+        if name not in FORMATS:
+            raise Http404("Unknown results format")
+        return name
+
+    def get_questions(self):
+        """Load (id, question_text, last_modified) of published questions."""
+        if not hasattr(self, 'questions'):
+            ids = self.get_question_ids()
+            rows = Question.objects.published().filter(pk__in=ids) \
+                .values_list('pk', 'question_text', 'last_modified')
+            found = {row[0]: row for row in rows}
+            self.questions = [found[pk] for pk in ids if pk in found]
+        return self.questions
+
+    def get_validators(self):
+        """Build the validators from ``last_modified`` of the questions."""
+        questions = self.get_questions()
+        key = "|".join([self.get_format()] + [
+            f"{pk}-{last_modified.timestamp()}"
+            for pk, _, last_modified in questions])
+        last_modified = max((question[2] for question in questions),
+                            default=None)
+        return hashlib.sha1(key.encode()).hexdigest(), last_modified
+
+
+class QuestionResultsAPI(ResultsAPIView):
+    """Results of one question, at ``api/questions/<pk>/results``."""
+
+    def get_question_ids(self):
+        """Return the question of the URL."""
+        return [self.kwargs['pk']]
+
+    def get_validators(self):
+        """Answer 404 before the validators of a missing question."""
+        if not self.get_questions():
+            raise Http404("Question does not exist")
+        return super().get_validators()
+
+    def get_payload(self):
+        """Return the results of the question."""
+        return load_results(self.get_questions(),
+                            self.get_format() == 'compact')[0]
+
+
+class BatchResultsAPI(ResultsAPIView):
+    """
+    Results of many questions, at ``api/results?ids=1,2,3``.
+
+    Questions that do not exist or are not published are left out.
+    """
+
+    def get_question_ids(self):
+        """Return the distinct ids of the query string, in their order."""
+        try:
+            ids = [int(pk) for pk in
+                   self.request.GET.get('ids', '').split(',') if pk]
+        except ValueError:
+            raise BadRequest("Invalid question ids")
+        ids = list(dict.fromkeys(ids))
+        if not ids or len(ids) > max_batch():
+            raise BadRequest(f"Ask for 1 to {max_batch()} question ids")
+        return ids
+
+    def get_payload(self):
+        """Return the results of every question found."""
+        return {'results': load_results(self.get_questions(),
+                                        self.get_format() == 'compact')}
+
+
+@method_decorator(gzip_page, name='dispatch')
+class QuestionTimelineAPI(ReplicaReadMixin, ConditionalGetMixin, JSONView):
+    """
+    Votes of one question per minute or hour, at
+    ``api/questions/<pk>/timeline?bucket=hour``.
+
+    ``since`` and ``until`` limit the buckets to an ISO 8601 range.
+    Every bucket is ``[start, counts]``, the counts in the order of
+    ``choices``. ``untimed`` votes were cast before times were recorded.
+    """
+
+    def get_object(self):
+        """Load the published question once."""
+        if not hasattr(self, 'object'):
+            try:
+                self.object = Question.objects.published().get(
+                    pk=self.kwargs['pk'])
+            except Question.DoesNotExist:
+                raise Http404("Question does not exist")
+        return self.object
+
+    def get_resolution(self):
+        """Return the bucket size chosen by the query string."""
+        resolution = self.request.GET.get('bucket', 'hour')
+        if resolution not in timeline.TRUNCATE:
+            raise Http404("Unknown bucket size")
+        return resolution
+
+    def get_moment(self, name):
+        """Return the aware datetime of a query string parameter."""
+        value = self.request.GET.get(name)
+        if not value:
+            return None
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise Http404(f"Invalid {name} time")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def get_validators(self):
+        """Build the validators from ``last_modified`` and the query."""
+        last_modified = self.get_object().last_modified
+        key = f"{self.object.pk}-{last_modified.timestamp()}-" \
+              f"{self.request.GET.urlencode()}"
+        return hashlib.sha1(key.encode()).hexdigest(), last_modified
+
+    def get_payload(self):
+        """Return the buckets with one count per choice."""
+        question = self.get_object()
+        choices = list(question.choice_set.order_by('pk').values_list(
+            'pk', flat=True))
+        index = {pk: position for position, pk in enumerate(choices)}
+        buckets = []
+        for start, choice_id, count in timeline.get_buckets(
+                question, self.get_resolution(), self.get_moment('since'),
+                self.get_moment('until')):
+            if not buckets or buckets[-1][0] != start:
+                buckets.append([start, [0] * len(choices)])
+            buckets[-1][1][index[choice_id]] = count
+        return {
+            'id': question.pk,
+            'bucket': self.get_resolution(),
+            'choices': choices,
+            'buckets': buckets,
+            'untimed': Vote.objects.filter(
+                question=question, created_at__isnull=True).count(),
+        }
@@ -0,0 +1,127 @@
+"""Archive of closed polls.
+
+Archiving freezes the final tally of a closed question in its choice
+counters, its statistics and its timeline buckets, then moves or deletes
+its votes in small batches. The results page reads the counters, so it
+keeps working when the votes are gone.
+"""
+import datetime
+import time
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from . import index_cache, results_cache, signals, stats, timeline
+from .models import ArchivedVote, Choice, ChoiceCounterShard, Question, Vote
+
+
+def default_retention():
+    """Return what happens to the votes of a question by default."""
+    return getattr(settings, 'POLLS_VOTE_RETENTION', 'move')
+
+
+def default_days():
+    """Return how many days after its end a poll is archived by default."""
+    return getattr(settings, 'POLLS_ARCHIVE_AFTER_DAYS', 30)
+
+
+def retention(question):
+    """Return ``keep``, ``move`` or ``delete`` for a question."""
+    return question.vote_retention or default_retention()
+
+
+def is_due(question, now=None):
+    """Return True when the retention of a closed question has passed."""
+    now = now or timezone.now()
+    days = question.retention_days
+    if days is None:
+        days = default_days()
+    return (question.end_date is not None
+            and question.end_date + datetime.timedelta(days=days) <= now
+            and retention(question) != 'keep')
+
+
+def due_questions(now=None):
+    """Return the closed questions to archive, with unfinished ones.
+
+    Returns:
+        list[Question]: questions not archived yet whose retention has
+        passed, and archived questions that still have votes.
+    """
+    now = now or timezone.now()
+    closed = Question.objects.filter(archived_at__isnull=True,
+                                     end_date__lt=now).order_by('pk')
+    due = [question for question in closed if is_due(question, now)]
+    unfinished = Question.objects.filter(
+        archived_at__isnull=False, vote__isnull=False).distinct()
+    return due + [question for question in unfinished.order_by('pk')
+                  if retention(question) != 'keep']
+
+
+def freeze(question):
+    """Store the final tally of a question and mark it archived.
+
+    The counters get the exact amount of the ``Vote`` table, shards
+    folded in, then the statistics and timeline buckets are stored.
+    """
+    if question.archived_at is not None:
+        return
+    with transaction.atomic():
+        choices = list(Choice.objects.filter(question=question).with_votes())
+        for choice in choices:
+            choice.vote_count = choice.num_votes
+        Choice.objects.bulk_update(choices, ['vote_count'])
+        ChoiceCounterShard.objects.filter(choice__question=question).delete()
+        stats.refresh([question], exact=True)
+        timeline.rollup(question)
+        question.archived_at = timezone.now()
+        Question.objects.filter(pk=question.pk).update(
+            archived_at=question.archived_at)
+        results_cache.invalidate(question.pk)
+        # an archived poll is listed as closed
+        index_cache.invalidate()
+
+
+def purge_votes(question, batch_size=1000, pause=0.0):
+    """Move or delete the votes of an archived question, batch by batch.
+
+    Each batch is its own short transaction, so voting on other polls is
+    never blocked for long. The counters are not changed, and the votes
+    of a question kept by its retention are left alone.
+
+    Returns:
+        int: the amount of votes moved or deleted.
+    """
+    mode = retention(question)
+    if mode == 'keep':
+        return 0
+    move = mode == 'move'
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(Vote.objects.filter(question=question).order_by(
+                'pk').values_list('pk', 'user_id', 'choice_id',
+                                  'created_at', 'updated_at')[:batch_size])
+            if not rows:
+                return total
+            if move:
+                ArchivedVote.objects.bulk_create(
+                    [ArchivedVote(id=pk, question=question, user_id=user_id,
+                                  choice_id=choice_id, created_at=created,
+                                  updated_at=updated)
+                     for pk, user_id, choice_id, created, updated in rows],
+                    ignore_conflicts=True)
+            with signals.archived(question.pk):
+                Vote.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        total += len(rows)
+        if pause:
+            time.sleep(pause)
+
+
+def archive(question, batch_size=1000, pause=0.0):
+    """Freeze the tally of a question, then purge its votes.
+
+    Returns:
+        int: the amount of votes moved or deleted.
+    """
+    freeze(question)
+    return purge_votes(question, batch_size, pause)
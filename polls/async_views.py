@@ -0,0 +1,155 @@
+"""Native async versions of the polls views for the ASGI server.
+
+They are routed instead of ``polls.views`` when ``POLLS_ASYNC_VIEWS`` is
+True, and reuse the logic of the sync views while every query goes
+through the async ORM interface.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from . import (index_cache, ingest, results_cache, routers, stats, streams,
+               views)
+from .models import Choice, Question, Vote
+from .ratelimit import rate_limit
+
+
+async def aget_user(request):
+    """Load the user of the request once, outside of the event loop.
+
+    Later ``request.user`` reads, in templates too, use the loaded user.
+    """
+    user = await sync_to_async(get_user)(request)
+    request.user = user
+    return user
+
+
+class IndexView(views.IndexView):
+    """Async index page, one keyset page of questions."""
+
+    async def get(self, request, *args, **kwargs):
+        """Return 304 when the client copy is current, else render."""
+        validators = self.build_validators(
+            *await sync_to_async(index_cache.get_version)())
+        response = self.not_modified(request, *validators)
+        if response is None:
+            self.object_list = [question async for question
+                                in self.get_page_queryset()]
+            response = self.render_to_response(self.get_context_data())
+        return self.add_validators(response, *validators)
+
+
+class DetailView(views.DetailView):
+    """Async detail page of a question for a logged in user."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Require a logged in user without blocking the event loop."""
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(views.DetailView, self).dispatch(
+            request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        """Render the question, or redirect when voting is not allowed."""
+        try:
+            self.object = await self.get_queryset().aget(pk=kwargs['pk'])
+        except Question.DoesNotExist:
+            raise Http404("No question found matching the query")
+        closed = views.voting_closed(request, self.object)
+        if closed is not None:
+            return closed
+        selected_choice_id = await Vote.objects.filter(
+            user=request.user, question=self.object
+        ).values_list('choice_id', flat=True).afirst()
+        # skip the sync vote lookup of views.DetailView
+        context = super(views.DetailView, self).get_context_data(
+            object=self.object, selected_choice_id=selected_choice_id)
+        return self.render_to_response(context)
+
+
+class ResultsView(views.ResultsView):
+    """Async results page, the tally comes from the results cache."""
+
+    async def get(self, request, *args, **kwargs):
+        """Return 304 when the client copy is current, else render."""
+        try:
+            self.object = await self.get_queryset().aget(pk=kwargs['pk'])
+        except Question.DoesNotExist:
+            raise Http404("No question found matching the query")
+        validators = self.get_validators()
+        response = self.not_modified(request, *validators)
+        if response is None:
+            self.choice_list = await results_cache.aget_tally(self.object)
+            response = self.render_to_response(
+                self.get_context_data(object=self.object))
+        return self.add_validators(response, *validators)
+
+
+@rate_limit('vote')
+async def vote(request, question_id):
+    """
+    Async voting that casts or changes the vote of the user with one
+    upsert and returns to the results page if successful.
+    """
+    user = await aget_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    try:
+        selected_choice = await Choice.objects.select_related(
+            'question').aget(pk=request.POST["choice"],
+                             question_id=question_id)
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        try:
+            # the form lists the choices, load them with the question
+            question = await Question.objects.prefetch_related(
+                'choice_set').aget(pk=question_id)
+        except Question.DoesNotExist:
+            raise Http404("Question does not exist")
+        return render(request, 'polls/detail.html', {
+                'question': question,
+                'error_message': "You didn't select a choice.",
+            })
+    closed = views.voting_closed(request, selected_choice.question)
+    if closed is not None:
+        return closed
+    if ingest.is_queued():
+        await sync_to_async(ingest.get_queue().enqueue)(
+            user.pk, selected_choice.question_id, selected_choice.pk)
+        messages.info(request, "Your vote was received and will be counted "
+                               "shortly.")
+        return routers.stick_to_primary(
+            redirect("polls:results", pk=question_id))
+    await Vote.objects.aupdate_or_create(
+        user=user, question=selected_choice.question,
+        defaults={'choice': selected_choice})
+    if stats.on_vote():
+        await sync_to_async(stats.refresh)([selected_choice.question])
+    return routers.stick_to_primary(redirect("polls:results", pk=question_id))
+
+
+async def results_stream(request, pk):
+    """
+    Stream the live results of a question as Server-Sent Events.
+
+    The first event is a snapshot of all counts, then a delta of the
+    counts that changed is sent each time votes land. A WSGI server would
+    hold a worker for the whole stream, so it gets 204 No Content, which
+    tells the browser not to reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    try:
+        question = await Question.objects.aget(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
+    subscription = await streams.get_hub().subscribe(question)
+    response = StreamingHttpResponse(subscription.events(),
+                                     content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # ask nginx style proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,69 @@
+"""Helpers shared by the ``bench_*`` management commands.
+
+Every benchmark runs on a scratch database created like a test database,
+so it never touches the data of the real site.
+"""
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from django.db import connection
+
+
+@contextmanager
+def scratch_database():
+    """Create a migrated, empty database for a benchmark and drop it after.
+
+    SQLite gets a temporary file instead of memory, so that threads and
+    processes of the benchmark share the same database.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if connection.vendor == 'sqlite':
+        handle, path = tempfile.mkstemp(prefix='polls-bench-',
+                                        suffix='.sqlite3')
+        os.close(handle)
+        test_settings['NAME'] = path
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       serialize=False)
+    try:
+        yield connection.settings_dict['NAME']
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+
+
+class Timer:
+    """Collect the duration of repeated operations."""
+
+    def __init__(self):
+        self.samples = []
+
+    @contextmanager
+    def measure(self):
+        """Time the code inside the ``with`` block as one sample."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.append(time.perf_counter() - start)
+
+    def percentile(self, percent):
+        """Return the given percentile of the samples in seconds."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1,
+                    round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def summary(self):
+        """Return a one-line report of mean, p50 and p99 in milliseconds."""
+        if not self.samples:
+            return "no samples"
+        return (f"n={len(self.samples)} "
+                f"mean={statistics.mean(self.samples) * 1000:.2f}ms "
+                f"p50={self.percentile(50) * 1000:.2f}ms "
+                f"p99={self.percentile(99) * 1000:.2f}ms")
@@ -0,0 +1,94 @@
+"""Denormalized vote counters of choices.
+
+Each ``Choice`` keeps its vote amount in ``vote_count`` so the results page
+never has to count the ``Vote`` table. The counters are changed with ``F()``
+expressions in the same transaction as the vote itself.
+
+A question with ``counter_shards`` above one spreads the writes over that
+many ``ChoiceCounterShard`` rows per choice, so concurrent voters do not
+all wait on the same row lock. Reads add the shards back up.
+"""
+import random
+from django.db.models import F
+from .models import Choice, ChoiceCounterShard, counter_total
+
+
+def add_votes(choice_id, amount, shards=1):
+    """Add ``amount`` votes to the counter of a choice.
+
+    With more than one shard a random shard row takes the change, it is
+    created the first time it is used.
+    """
+    if shards <= 1:
+        Choice.objects.filter(pk=choice_id).update(
+            vote_count=F('vote_count') + amount)
+        return
+    shard = random.randrange(shards)
+    updated = ChoiceCounterShard.objects.filter(
+        choice_id=choice_id, shard=shard
+    ).update(count=F('count') + amount)
+    if not updated:
+        _, created = ChoiceCounterShard.objects.get_or_create(
+            choice_id=choice_id, shard=shard, defaults={'count': amount})
+        if not created:
+            ChoiceCounterShard.objects.filter(
+                choice_id=choice_id, shard=shard
+            ).update(count=F('count') + amount)
+
+
+def record_vote(old_choice_id, new_choice_id, shards=1):
+    """Move one vote from ``old_choice_id`` to ``new_choice_id``.
+
+    Either id may be None, for a new vote or a removed vote.
+    """
+    if old_choice_id == new_choice_id:
+        return
+    if old_choice_id is not None:
+        add_votes(old_choice_id, -1, shards)
+    if new_choice_id is not None:
+        add_votes(new_choice_id, 1, shards)
+
+
+def find_drift(choices=None):
+    """Compare the counters with the ``Vote`` table.
+
+    Choices of archived questions are skipped, their votes are gone and
+    their counters hold the final tally.
+
+    Args:
+        choices: queryset of choices to check, all choices by default.
+
+    Returns:
+        list[Choice]: choices whose counter is wrong, each one carries
+        its counter total as ``counter`` and the exact amount as
+        ``num_votes``.
+    """
+    if choices is None:
+        choices = Choice.objects.all()
+    choices = choices.filter(question__archived_at__isnull=True)
+    choices = choices.with_votes().annotate(counter=counter_total())
+    return [choice for choice in choices.order_by('pk')
+            if choice.counter != choice.num_votes]
+
+
+def repair(drifted):
+    """Write the exact amount found by ``find_drift()`` into the counters.
+
+    The shards of a repaired choice are removed, its whole amount is kept
+    in ``vote_count``.
+    """
+    for choice in drifted:
+        choice.vote_count = choice.num_votes
+    Choice.objects.bulk_update(drifted, ['vote_count'], batch_size=500)
+    ChoiceCounterShard.objects.filter(choice__in=drifted).delete()
+
+
+def rebuild(choices=None):
+    """Repair the counters which drifted from the ``Vote`` table.
+
+    Returns:
+        list[Choice]: the repaired choices.
+    """
+    drifted = find_drift(choices)
+    repair(drifted)
+    return drifted
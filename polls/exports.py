@@ -0,0 +1,72 @@
+"""Streaming export of questions, choices and votes as CSV or NDJSON.
+
+Rows are read with ``QuerySet.iterator()`` and written one line at a time,
+so exporting a large archive uses the same memory as a small one.
+"""
+import csv
+import datetime
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Choice, Vote
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# exported columns of each kind, in order
+FIELDS = {
+    'questions': ('id', 'question_text', 'pub_date', 'end_date'),
+    'choices': ('id', 'question_id', 'choice_text', 'votes'),
+    'votes': ('id', 'user_id', 'question_id', 'choice_id', 'created_at'),
+}
+
+
+def export_queryset(kind, questions):
+    """Return the rows of one kind that belong to the questions.
+
+    Args:
+        kind: one of ``FIELDS``.
+        questions: the filtered questions to export.
+
+    Returns:
+        QuerySet: tuples with the values of ``FIELDS[kind]``.
+    """
+    if kind == 'questions':
+        return questions.order_by('pk').values_list(*FIELDS[kind])
+    if kind == 'choices':
+        return Choice.objects.filter(question__in=questions).with_counters(
+        ).order_by('pk').values_list('id', 'question_id', 'choice_text',
+                                     'num_votes')
+    return Vote.objects.filter(question__in=questions).order_by(
+        'pk').values_list(*FIELDS[kind])
+
+
+class Echo:
+    """File-like object that returns what is written, for ``csv.writer``."""
+
+    def write(self, value):
+        """Return the written line instead of storing it."""
+        return value
+
+
+def _text(value):
+    """Return a datetime in ISO 8601, other values as they are."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(kind, questions, output_format='csv', chunk_size=2000):
+    """Yield the exported rows of one kind as lines of text.
+
+    CSV starts with a header line, NDJSON has one object per line.
+    """
+    fields = FIELDS[kind]
+    rows = export_queryset(kind, questions).iterator(chunk_size=chunk_size)
+    if output_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([_text(value) for value in row])
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(dict(zip(fields, row))) + '\n'
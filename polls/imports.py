@@ -0,0 +1,234 @@
+"""Bulk import of users, questions, choices and votes.
+
+Records are read one at a time from JSON fixtures (like ``polls.json``),
+NDJSON or CSV, and written with ``bulk_create()`` in batches. Primary keys
+of the input are not kept, foreign keys are resolved through maps from the
+input id to the id of the created row, so every referenced row must come
+earlier in the same import. Signals do not run; the vote counters of the
+imported questions are rebuilt at the end.
+"""
+import csv
+import datetime
+import json
+import os
+import re
+from django.apps import apps
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.utils import timezone
+from . import counters, index_cache
+from .models import Choice
+
+# models in the order they depend on each other
+ORDER = ('auth.user', 'polls.question', 'polls.choice', 'polls.vote')
+DEPENDS = {
+    'polls.choice': ('polls.question',),
+    'polls.vote': ('auth.user', 'polls.choice'),
+}
+# model of the rows of export_polls and CSV files, which carry no model
+KINDS = {
+    'users': 'auth.user',
+    'questions': 'polls.question',
+    'choices': 'polls.choice',
+    'votes': 'polls.vote',
+}
+# exported columns that are computed, not stored
+COMPUTED = {'polls.choice': ('votes',)}
+# algorithm$...$digest, the shape of every Django password hash
+HASHED = re.compile(r'[a-z][a-z0-9_]*\$.*\$[A-Za-z0-9+/.=]{20,}')
+
+
+def iter_json_array(handle, chunk_size=65536):
+    """Yield the objects of a JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = handle.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("A JSON file must hold an array of records.")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            more = handle.read(chunk_size)
+            if not more:
+                raise ValueError("The JSON array is not terminated.")
+            buffer += more
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+
+def read_records(path, kind=None):
+    """Yield (model label, input id, fields) of every record of a file.
+
+    Records may be fixture objects with ``model``, ``pk`` and ``fields``,
+    or flat rows like those of ``export_polls``, whose model is ``kind``.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as handle:
+        if extension == '.json':
+            rows = iter_json_array(handle)
+        elif extension in ('.ndjson', '.jsonl'):
+            rows = (json.loads(line) for line in handle if line.strip())
+        elif extension == '.csv':
+            rows = csv.DictReader(handle)
+        else:
+            raise ValueError(f"Unknown file type: {path}")
+        for row in rows:
+            if 'model' in row:
+                yield row['model'].lower(), row.get('pk'), row['fields']
+                continue
+            if kind is None:
+                raise ValueError(f"{path} has flat rows, give its kind.")
+            label = KINDS[kind]
+            fields = {}
+            for name, value in row.items():
+                if name in COMPUTED.get(label, ()):
+                    continue
+                if name.endswith('_id'):
+                    name = name[:-3]
+                fields[name] = value
+            yield label, fields.pop('id', None), fields
+
+
+class Importer:
+    """Buffer records by model and write them in batches.
+
+    ``ids`` maps the input id of every written row to its new id.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.ids = {label: {} for label in ORDER}
+        self.pending = {label: [] for label in ORDER}
+        self.counts = {label: 0 for label in ORDER}
+        # question of every created choice, votes may not name it
+        self.choice_questions = {}
+
+    def add(self, label, pk, fields):
+        """Queue one record, write its model when the batch is full."""
+        if label not in self.pending:
+            raise ValueError(f"Cannot import {label} records.")
+        self.pending[label].append((pk, fields))
+        self.counts[label] += 1
+        if len(self.pending[label]) >= self.batch_size:
+            self.flush(label)
+
+    def flush(self, label):
+        """Write the queued records of a model, after those it refers to."""
+        for dependency in DEPENDS.get(label, ()):
+            self.flush(dependency)
+        records, self.pending[label] = self.pending[label], []
+        if not records:
+            return
+        model = apps.get_model(label)
+        objs = [self.build(model, label, pk, fields) for pk, fields in records]
+        if label == 'auth.user':
+            records, objs = self.skip_existing_users(records, objs)
+        if label == 'polls.vote':
+            # one vote per user and question, the first one is kept
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+            return
+        model.objects.bulk_create(objs)
+        for (pk, _), obj in zip(records, objs):
+            if pk is not None:
+                self.ids[label][int(pk)] = obj.pk
+            if label == 'polls.choice':
+                self.choice_questions[obj.pk] = obj.question_id
+
+    def skip_existing_users(self, records, objs):
+        """Map users whose username exists to the existing user."""
+        model = apps.get_model('auth.user')
+        existing = dict(model.objects.filter(
+            username__in=[obj.username for obj in objs]
+        ).values_list('username', 'pk'))
+        kept = []
+        for (pk, fields), obj in zip(records, objs):
+            if obj.username in existing:
+                if pk is not None:
+                    self.ids['auth.user'][int(pk)] = existing[obj.username]
+                continue
+            existing[obj.username] = None
+            kept.append(((pk, fields), obj))
+        return [record for record, _ in kept], [obj for _, obj in kept]
+
+    def build(self, model, label, pk, fields):
+        """Return the unsaved object of one record."""
+        values = {}
+        for name, value in fields.items():
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ValueError(f"{label} {pk}: unknown field {name}")
+            if field.many_to_many:
+                continue
+            if value == '' and field.null:
+                value = None
+            if field.is_relation:
+                values[field.attname] = self.resolve(
+                    field.related_model._meta.label_lower, value, label, pk)
+                continue
+            try:
+                value = field.to_python(value)
+            except ValidationError as error:
+                raise ValueError(f"{label} {pk}: {name}: "
+                                 f"{' '.join(error.messages)}")
+            if isinstance(value, datetime.datetime) \
+                    and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            values[field.attname] = value
+        if label == 'auth.user':
+            values['password'] = self.password(values.get('password'),
+                                               label, pk)
+        if label == 'polls.vote':
+            question_id = self.choice_questions[values['choice_id']]
+            if values.setdefault('question_id', question_id) != question_id:
+                raise ValueError(f"{label} {pk}: the choice is not one of "
+                                 f"the question")
+        return model(**values)
+
+    def resolve(self, related, value, label, pk):
+        """Return the new id of a row referred to by its input id."""
+        if value is None:
+            return None
+        try:
+            return self.ids[related][int(value)]
+        except (KeyError, ValueError):
+            raise ValueError(f"{label} {pk}: unknown {related} {value}")
+
+    @staticmethod
+    def password(value, label, pk):
+        """Keep a hashed password, hash a raw one, unusable when empty.
+
+        A hash of an algorithm missing from ``PASSWORD_HASHERS`` is an
+        error, hashing it again would give a password nobody knows.
+        """
+        if not value:
+            return make_password(None)
+        try:
+            identify_hasher(value)
+        except ValueError:
+            if HASHED.fullmatch(value):
+                algorithm = value.split('$', 1)[0]
+                raise ValueError(f"{label} {pk}: password: unknown hasher "
+                                 f"{algorithm}")
+            return make_password(value)
+        return value
+
+    def finish(self):
+        """Write what is left and rebuild the counters of new questions.
+
+        Returns:
+            dict: amount of records read by model label.
+        """
+        for label in ORDER:
+            self.flush(label)
+        counters.rebuild(Choice.objects.filter(
+            question_id__in=self.ids['polls.question'].values()))
+        if self.counts['polls.question']:
+            # bulk_create() sends no post_save
+            index_cache.invalidate()
+        return self.counts
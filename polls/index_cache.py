@@ -0,0 +1,77 @@
+"""Version of the index pages, kept in the cache.
+
+The index validators are built from this version instead of an aggregate
+of the whole questions table. Writing a question bumps it, and so does
+the first request after a question is published or reaches its end date,
+the moment the next such change happens being stored with the version.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from . import routers
+from .models import Question
+
+VERSION_KEY = 'polls:index:version'
+CHANGED_KEY = 'polls:index:changed'
+BOUNDARY_KEY = 'polls:index:boundary'
+
+
+def _bump():
+    """Increase the index version and remember when it changed."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # start from the clock so a lost version key never goes back
+        cache.add(VERSION_KEY, time.time_ns(), None)
+    cache.set(CHANGED_KEY, timezone.now(), None)
+
+
+def invalidate():
+    """Mark every index page as changed.
+
+    The version is bumped right away and again after the transaction
+    commits, so a page rendered from uncommitted data is not kept.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def next_change(now):
+    """Return when a question is next published or closed, None if never.
+
+    Each date is the first one of an index on it.
+    """
+    dates = []
+    with routers.primary():
+        for field in ('pub_date', 'end_date'):
+            date = Question.objects.filter(**{f'{field}__gte': now}).order_by(
+                field).values_list(field, flat=True).first()
+            if date is not None:
+                dates.append(date)
+    return min(dates, default=None)
+
+
+def get_version(now=None):
+    """Return the version of the index and the time it last changed.
+
+    Returns:
+        tuple: (version, datetime of the last change).
+    """
+    now = now or timezone.now()
+    entries = cache.get_many([VERSION_KEY, CHANGED_KEY, BOUNDARY_KEY])
+    version = entries.get(VERSION_KEY)
+    if version is None:
+        _bump()
+        entries = cache.get_many([VERSION_KEY, CHANGED_KEY])
+        version = entries[VERSION_KEY]
+    boundary = entries.get(BOUNDARY_KEY)
+    if boundary is not None and boundary[0] == version:
+        if boundary[1] is None or now <= boundary[1]:
+            return version, entries.get(CHANGED_KEY)
+        # a question was published or closed since the last request
+        _bump()
+        entries = cache.get_many([VERSION_KEY, CHANGED_KEY])
+        version = entries[VERSION_KEY]
+    cache.set(BOUNDARY_KEY, (version, next_change(now)), None)
+    return version, entries.get(CHANGED_KEY)
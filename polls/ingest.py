@@ -0,0 +1,154 @@
+"""Write-behind ingestion of votes for poll opening spikes.
+
+With ``POLLS_VOTE_INGEST = 'queued'`` the vote view only appends the vote
+to a durable queue, a separate SQLite file in WAL mode, and returns right
+away. The ``process_votes`` command drains the queue in batched
+transactions, keeping the last vote of each (user, question).
+"""
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from . import stats
+from .models import Choice, Vote
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vote_queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    choice_id INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL
+)
+"""
+
+
+def is_queued():
+    """Return True when votes go through the write-behind queue."""
+    return getattr(settings, 'POLLS_VOTE_INGEST', 'sync') == 'queued'
+
+
+class VoteQueue:
+    """Durable FIFO queue of votes waiting to be written.
+
+    Args:
+        path: file of the queue, ``POLLS_VOTE_QUEUE_PATH`` by default.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or settings.POLLS_VOTE_QUEUE_PATH)
+        self._local = threading.local()
+
+    def connect(self):
+        """Return the connection of this thread, creating the queue once."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Close the connection of this thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def enqueue(self, user_id, question_id, choice_id):
+        """Append one vote to the queue."""
+        self.connect().execute(
+            "INSERT INTO vote_queue (user_id, question_id, choice_id, "
+            "enqueued_at) VALUES (?, ?, ?, ?)",
+            (user_id, question_id, choice_id, time.time()))
+
+    def take(self, limit):
+        """Return up to ``limit`` of the oldest votes without removing them.
+
+        Returns:
+            list[tuple]: rows of (seq, user_id, question_id, choice_id,
+            enqueued_at).
+        """
+        return self.connect().execute(
+            "SELECT seq, user_id, question_id, choice_id, enqueued_at "
+            "FROM vote_queue ORDER BY seq LIMIT ?", (limit,)).fetchall()
+
+    def remove(self, last_seq):
+        """Remove every vote up to ``last_seq`` after it has been applied."""
+        self.connect().execute("DELETE FROM vote_queue WHERE seq <= ?",
+                               (last_seq,))
+
+    def depth(self):
+        """Return the amount of votes waiting in the queue."""
+        return self.connect().execute(
+            "SELECT COUNT(*) FROM vote_queue").fetchone()[0]
+
+    def lag(self):
+        """Return the age in seconds of the oldest waiting vote."""
+        oldest = self.connect().execute(
+            "SELECT MIN(enqueued_at) FROM vote_queue").fetchone()[0]
+        return time.time() - oldest if oldest is not None else 0.0
+
+
+_queue = None
+
+
+def get_queue():
+    """Return the vote queue shared by this process."""
+    global _queue
+    if _queue is None or _queue.path != str(settings.POLLS_VOTE_QUEUE_PATH):
+        _queue = VoteQueue()
+    return _queue
+
+
+def apply_batch(rows):
+    """Write a batch of queued votes in one transaction.
+
+    Only the last vote of each (user, question) is applied, votes of a user
+    or for a choice deleted, or a question archived, in the meantime are
+    dropped, so one such vote never blocks the queue.
+
+    Returns:
+        int: the amount of votes written.
+    """
+    latest = {}
+    for _, user_id, question_id, choice_id, _ in rows:
+        latest[user_id, question_id] = choice_id
+    choices = Choice.objects.select_related('question').in_bulk(
+        set(latest.values()))
+    users = User.objects.in_bulk({user_id for user_id, _ in latest})
+    applied = 0
+    with transaction.atomic():
+        for (user_id, question_id), choice_id in latest.items():
+            choice = choices.get(choice_id)
+            if (choice is None or user_id not in users
+                    or choice.question_id != question_id
+                    or choice.question.archived_at is not None):
+                continue
+            Vote.objects.update_or_create(
+                user_id=user_id, question=choice.question,
+                defaults={'choice': choice})
+            applied += 1
+    return applied
+
+
+def drain(queue, batch_size=500):
+    """Apply one batch of the queue.
+
+    Returns:
+        tuple: (votes taken from the queue, votes written, lag in seconds
+        between enqueue and apply of the oldest vote of the batch).
+    """
+    rows = queue.take(batch_size)
+    if not rows:
+        return 0, 0, 0.0
+    applied = apply_batch(rows)
+    # one refresh of the statistics per batch, from the counters
+    stats.refresh_ids({row[2] for row in rows})
+    queue.remove(rows[-1][0])
+    return len(rows), applied, time.time() - rows[0][4]
@@ -0,0 +1,48 @@
+"""Archive closed polls and compact their votes."""
+from django.core.management.base import BaseCommand
+from polls import archive, paginators
+from polls.models import ArchivedVote, Question, Vote
+
+
+class Command(BaseCommand):
+    """Freeze the final tally of closed polls, then move or delete votes."""
+
+    help = "Archive the closed polls whose retention has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Archive these closed questions, due or "
+                                 "not.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Votes moved or deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the questions to archive.")
+
+    def handle(self, *args, **options):
+        if options['question_ids']:
+            questions = list(Question.objects.closed().filter(
+                pk__in=options['question_ids']).order_by('pk'))
+        else:
+            questions = archive.due_questions()
+        total = 0
+        for question in questions:
+            mode = archive.retention(question)
+            if options['dry_run']:
+                self.stdout.write(f"question {question.pk}: would {mode} "
+                                  f"{question.vote_set.count()} vote(s)")
+                continue
+            purged = archive.archive(question, options['batch_size'],
+                                     options['pause'])
+            total += purged
+            action = 'kept' if mode == 'keep' else f"{mode}d"
+            self.stdout.write(f"question {question.pk}: {purged} vote(s) "
+                              f"{action}")
+        if total:
+            # the admin estimates the size of the vote tables from these
+            paginators.refresh_estimates(Vote, ArchivedVote)
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"archived {len(questions)} question(s), "
+                f"{total} vote(s) compacted."))
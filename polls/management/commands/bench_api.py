@@ -0,0 +1,79 @@
+"""Benchmark the JSON results API against the HTML results page."""
+import datetime
+import random
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+from polls.api import BatchResultsAPI, QuestionResultsAPI
+from polls.benchmarks import Timer, scratch_database
+from polls.models import Choice, Question
+from polls.views import ResultsView
+
+
+class Command(BaseCommand):
+    """Time each results response and report its size, plain and gzipped."""
+
+    help = "Compare the JSON results API with the HTML results page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--choices', type=int, default=5,
+                            help="Choices per question.")
+        parser.add_argument('--batch', type=int, default=50,
+                            help="Questions per batch request.")
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            ids = self.generate(options['questions'], options['choices'])
+            pk = ids[0]
+            batch = ','.join(str(pk) for pk in ids[:options['batch']])
+            results = ResultsView.as_view()
+            single = QuestionResultsAPI.as_view()
+            many = BatchResultsAPI.as_view()
+            for name, view, path, params, kwargs in (
+                    ('html page', results, f'/polls/{pk}/results/', {},
+                     {'pk': pk}),
+                    ('json full', single, 'api', {}, {'pk': pk}),
+                    ('json compact', single, 'api', {'format': 'compact'},
+                     {'pk': pk}),
+                    (f'batch {options["batch"]} full', many, 'api',
+                     {'ids': batch}, {}),
+                    (f'batch {options["batch"]} compact', many, 'api',
+                     {'ids': batch, 'format': 'compact'}, {})):
+                self.measure(name, view, path, params, kwargs,
+                             options['repeat'])
+
+    def measure(self, name, view, path, params, kwargs, repeat):
+        """Time one view and write its latency and response sizes."""
+        factory = RequestFactory()
+        timer = Timer()
+        for _ in range(repeat):
+            request = factory.get(path, params)
+            request.user = AnonymousUser()
+            with timer.measure():
+                response = view(request, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+        request = factory.get(path, params, HTTP_ACCEPT_ENCODING='gzip')
+        request.user = AnonymousUser()
+        zipped = view(request, **kwargs)
+        if hasattr(zipped, 'render'):
+            # the HTML page is not gzipped by the site, only the API is
+            zipped.render()
+        self.stdout.write(f"{name:<18} {timer.summary()} "
+                          f"bytes={len(response.content)} "
+                          f"sent={len(zipped.content)}")
+
+    def generate(self, questions, choices):
+        """Create published questions with random vote counters."""
+        pub_date = timezone.now() - datetime.timedelta(days=1)
+        created = Question.objects.bulk_create(
+            Question(question_text=f"Question {index}?", pub_date=pub_date)
+            for index in range(questions))
+        Choice.objects.bulk_create(
+            Choice(question=question, choice_text=f"Choice {index}",
+                   vote_count=random.randint(0, 100_000))
+            for question in created for index in range(choices))
+        return [question.pk for question in created]
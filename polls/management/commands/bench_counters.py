@@ -0,0 +1,69 @@
+"""Benchmark vote throughput with and without sharded counters."""
+import datetime
+import random
+import threading
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.utils import timezone
+from polls.benchmarks import scratch_database
+from polls.models import Question, Vote
+
+
+class Command(BaseCommand):
+    """Cast votes on one hot question from concurrent writer threads."""
+
+    help = "Compare vote throughput of unsharded and sharded counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8,
+                            help="Concurrent writer threads.")
+        parser.add_argument('--votes', type=int, default=2000,
+                            help="Votes cast by each run.")
+        parser.add_argument('--shards', type=int, default=8,
+                            help="Shard count of the sharded run.")
+        parser.add_argument('--choices', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            users = User.objects.bulk_create(
+                User(username=f"bench{index}")
+                for index in range(options['votes']))
+            for shards in (1, options['shards']):
+                rate, errors = self.run(users, shards, options)
+                self.stdout.write(f"shards={shards:<3} writers="
+                                  f"{options['writers']:<3} "
+                                  f"{rate:9.1f} votes/s "
+                                  f"{errors} lock error(s)")
+
+    def run(self, users, shards, options):
+        """Cast one vote for every user and return votes/s and errors."""
+        question = Question.objects.create(
+            question_text=f"Hot question {shards}",
+            pub_date=timezone.now() - datetime.timedelta(days=1),
+            counter_shards=shards)
+        choices = [question.choice_set.create(choice_text=f"Choice {index}")
+                   for index in range(options['choices'])]
+        errors = []
+
+        def write(batch):
+            try:
+                for user in batch:
+                    try:
+                        Vote(user=user, choice=random.choice(choices)).save()
+                    except OperationalError:
+                        errors.append(user.pk)
+            finally:
+                connection.close()
+
+        writers = options['writers']
+        threads = [threading.Thread(target=write, args=(users[i::writers],))
+                   for i in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return (len(users) - len(errors)) / elapsed, len(errors)
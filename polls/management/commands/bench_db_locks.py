@@ -0,0 +1,86 @@
+"""Load test the database settings with concurrent readers and voters."""
+import datetime
+import random
+import threading
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.utils import timezone
+from polls.benchmarks import Timer, scratch_database
+from polls.models import Choice, Question, Vote
+
+# what the settings gave before the database profiles
+BARE = {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+        'PRAGMAS': {'journal_mode': 'delete', 'synchronous': 'full',
+                    'mmap_size': 0}}
+
+
+class Command(BaseCommand):
+    """Compare the bare SQLite settings with the configured profile."""
+
+    help = "Measure throughput and lock errors of concurrent requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16,
+                            help="Concurrent request threads.")
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help="Seconds each profile is loaded.")
+        parser.add_argument('--write-ratio', type=float, default=0.3,
+                            help="Share of the requests that vote.")
+        parser.add_argument('--users', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        configured = {key: connection.settings_dict.get(key)
+                      for key in BARE}
+        with scratch_database():
+            users = list(User.objects.bulk_create(
+                User(username=f"bench{index}")
+                for index in range(options['users'])))
+            for name, profile in (('bare', BARE), ('profile', configured)):
+                connection.close()
+                connection.settings_dict.update(profile)
+                self.stdout.write(f"{name:<8} {self.run(users, options)}")
+            connection.close()
+            connection.settings_dict.update(configured)
+
+    def run(self, users, options):
+        """Load one hot question and return a one-line report."""
+        question = Question.objects.create(
+            question_text="Hot question",
+            pub_date=timezone.now() - datetime.timedelta(days=1))
+        choices = [question.choice_set.create(choice_text=f"Choice {index}")
+                   for index in range(4)]
+        timer = Timer()
+        errors = []
+        deadline = time.perf_counter() + options['duration']
+
+        def serve():
+            while time.perf_counter() < deadline:
+                try:
+                    with timer.measure():
+                        if random.random() < options['write_ratio']:
+                            Vote.objects.update_or_create(
+                                user=random.choice(users), question=question,
+                                defaults={'choice': random.choice(choices)})
+                        else:
+                            list(Choice.objects.filter(
+                                question=question).with_counters())
+                except OperationalError:
+                    errors.append(1)
+                finally:
+                    # what the end of a request does with the connection
+                    close_old_connections()
+            connection.close()
+
+        threads = [threading.Thread(target=serve)
+                   for _ in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        served = len(timer.samples) - len(errors)
+        rate = served / options['duration']
+        error_rate = 100 * len(errors) / max(len(timer.samples), 1)
+        return (f"{rate:8.1f} req/s {len(errors)} lock error(s) "
+                f"({error_rate:.2f}%) {timer.summary()}")
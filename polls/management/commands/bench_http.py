@@ -0,0 +1,101 @@
+"""Load test a running server with many concurrent keep-alive clients."""
+import asyncio
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from polls.benchmarks import Timer
+
+
+async def fetch(reader, writer, host, target):
+    """Send one GET on a keep-alive connection and read the response.
+
+    Returns:
+        int: the status code of the response.
+    """
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Connection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+    headers = {name.lower(): value for name, value in headers.items()}
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    return status
+
+
+class Command(BaseCommand):
+    """
+    Measure requests/s and latency of a running server.
+
+    Compare the WSGI deployment, e.g. ``gunicorn mysite.wsgi``, with the
+    ASGI one, ``ASYNC_VIEWS=True uvicorn mysite.asgi:application``, by
+    running this command against each of them.
+    """
+
+    help = "Load test a running server, report requests/s and p99 latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="e.g. http://127.0.0.1:8000/polls/")
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help="Seconds to run.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError("Only plain http:// URLs are supported.")
+        start = time.monotonic()
+        timer, statuses, errors = asyncio.run(self.run(
+            url, options['clients'], options['duration']))
+        # requests in flight at the deadline still finish
+        elapsed = time.monotonic() - start
+        self.stdout.write(f"clients={options['clients']} "
+                          f"requests={len(timer.samples)} "
+                          f"elapsed={elapsed:.1f}s "
+                          f"rate={len(timer.samples) / elapsed:.1f} req/s "
+                          f"errors={errors}")
+        self.stdout.write(timer.summary())
+        self.stdout.write("status codes: " + ", ".join(
+            f"{code}={count}" for code, count in sorted(statuses.items())))
+
+    async def run(self, url, clients, duration):
+        """Run every client until the duration is over."""
+        timer = Timer()
+        statuses = {}
+        errors = 0
+        target = url.path or '/'
+        if url.query:
+            target += '?' + url.query
+        host = url.netloc
+        deadline = time.monotonic() + duration
+
+        async def client():
+            nonlocal errors
+            writer = None
+            while time.monotonic() < deadline:
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(
+                            url.hostname, url.port or 80)
+                    with timer.measure():
+                        status = await fetch(reader, writer, host, target)
+                    statuses[status] = statuses.get(status, 0) + 1
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    if writer is not None:
+                        writer.close()
+                    writer = None
+                    await asyncio.sleep(0.1)
+            if writer is not None:
+                writer.close()
+
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return timer, statuses, errors
@@ -0,0 +1,78 @@
+"""Benchmark keyset pages of the index against OFFSET pages."""
+import datetime
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+from polls.benchmarks import Timer, scratch_database
+from polls.models import Question
+from polls.views import IndexView, encode_cursor
+
+
+class Command(BaseCommand):
+    """
+    Time whole index requests, first page, deep page and 304, on a
+    generated archive, against the page query with OFFSET.
+    """
+
+    help = "Compare the cost of index page 1 and a deep page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=1_000_000,
+                            help="Size of the generated archive.")
+        parser.add_argument('--size', type=int, default=5,
+                            help="Questions per page.")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.generate(options['questions'])
+            size = options['size']
+            # cursor of the page near the end of the archive
+            deep = options['questions'] - size - 1
+            last = Question.objects.order_by('-pub_date', '-pk')[deep]
+            first = {'size': size}
+            etag = self.request(first).headers['ETag']
+            for name, params, headers in (
+                    ('keyset page 1', first, {}),
+                    ('keyset deep page', {'size': size,
+                                          'after': encode_cursor(last)}, {}),
+                    ('page 1 not modified', first, {'If-None-Match': etag})):
+                timer = Timer()
+                for _ in range(options['repeat']):
+                    with timer.measure():
+                        response = self.request(params, headers)
+                self.stdout.write(f"{name:<20} {timer.summary()} "
+                                  f"status={response.status_code}")
+            for name, offset in (('offset page 1', 0),
+                                 ('offset deep page', deep)):
+                timer = Timer()
+                for _ in range(options['repeat']):
+                    with timer.measure():
+                        list(Question.objects.order_by(
+                            '-pub_date', '-pk')[offset:offset + size + 1])
+                self.stdout.write(f"{name:<20} {timer.summary()}")
+
+    @staticmethod
+    def request(params, headers=None):
+        """
+        Return the rendered response of an anonymous index request, the
+        validators, the page and the template all run.
+        """
+        request = RequestFactory().get('/polls/', params,
+                                       headers=headers or {})
+        request.user = AnonymousUser()
+        response = IndexView.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def generate(self, amount, batch_size=10_000):
+        """Create an archive of published questions, one per minute."""
+        start = timezone.now() - datetime.timedelta(minutes=amount + 1)
+        for first in range(0, amount, batch_size):
+            Question.objects.bulk_create(
+                Question(question_text=f"Question {index}",
+                         pub_date=start + datetime.timedelta(minutes=index))
+                for index in range(first, min(first + batch_size, amount)))
+        self.stdout.write(f"generated {amount} questions")
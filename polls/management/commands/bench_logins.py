@@ -0,0 +1,57 @@
+"""Benchmark logins per second per core of each password hasher."""
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from mysite.hashers import PROFILES, password_hashers
+from polls.benchmarks import Timer, scratch_database
+
+# the hash of users.json, made by Django 4.1
+LEGACY = 'pbkdf2_sha256$390000'
+
+
+class Command(BaseCommand):
+    """Time ``authenticate()`` with every hasher profile on one core."""
+
+    help = "Compare logins/s per core of the password hasher profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20,
+                            help="Logins timed per profile.")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            for name in PROFILES:
+                with override_settings(
+                        PASSWORD_HASHERS=password_hashers(name)):
+                    try:
+                        if get_hasher().library:
+                            get_hasher()._load_library()
+                    except ValueError as error:
+                        self.stdout.write(f"{name:<8} skipped: {error}")
+                        continue
+                    self.stdout.write(f"{name:<8} {self.run(name, options)}")
+
+    def run(self, name, options):
+        """Log one user in repeatedly and return a one-line report."""
+        user = User.objects.create_user(username=f"bench-{name}",
+                                        password="correct horse")
+        timer = Timer()
+        for _ in range(options['logins']):
+            with timer.measure():
+                authenticate(username=user.username,
+                             password="correct horse")
+        # a users.json password is rehashed at its first login
+        legacy = User.objects.create_user(username=f"legacy-{name}")
+        legacy.password = get_hasher('pbkdf2_sha256').encode(
+            "correct horse", get_hasher().salt(), 390000)
+        legacy.save()
+        with timer.measure():
+            authenticate(username=legacy.username, password="correct horse")
+        legacy.refresh_from_db()
+        timer.samples, first = timer.samples[:-1], timer.samples[-1]
+        mean = sum(timer.samples) / len(timer.samples)
+        return (f"{1 / mean:7.1f} logins/s/core {timer.summary()} "
+                f"first login of a {LEGACY} hash {first * 1000:.0f}ms, "
+                f"now {legacy.password.split('$')[0]}")
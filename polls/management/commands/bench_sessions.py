@@ -0,0 +1,79 @@
+"""Count the queries of each view with each session and message storage."""
+import datetime
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from polls.benchmarks import scratch_database
+from polls.models import Question
+
+SESSIONS = 'django.contrib.sessions.backends.'
+MESSAGES = 'django.contrib.messages.storage.'
+SETUPS = [
+    ('db + fallback', SESSIONS + 'db', MESSAGES + 'fallback.FallbackStorage'),
+    ('db + cookie', SESSIONS + 'db', MESSAGES + 'cookie.CookieStorage'),
+    ('cached_db + cookie', SESSIONS + 'cached_db',
+     MESSAGES + 'cookie.CookieStorage'),
+    ('signed_cookies + cookie', SESSIONS + 'signed_cookies',
+     MESSAGES + 'cookie.CookieStorage'),
+]
+
+
+class Command(BaseCommand):
+    """Write the queries per request of every view, once caches are warm."""
+
+    help = "Compare queries per request of the session and message storages."
+
+    def handle(self, *args, **options):
+        with scratch_database(), override_settings(
+                ALLOWED_HOSTS=['testserver']):
+            question = Question.objects.create(
+                question_text="Session question",
+                pub_date=timezone.now() - datetime.timedelta(days=1))
+            choices = [question.choice_set.create(choice_text=text)
+                       for text in ("Yes", "No")]
+            user = User.objects.create_user(username="voter",
+                                            password="password")
+            views = [
+                ('index', 'get', reverse('polls:index'), {}),
+                ('results', 'get',
+                 reverse('polls:results', args=(question.pk,)), {}),
+                ('api', 'get',
+                 reverse('polls:api_results', args=(question.pk,)), {}),
+                ('detail', 'get',
+                 reverse('polls:detail', args=(question.pk,)), {}),
+                ('vote', 'post', reverse('polls:vote', args=(question.pk,)),
+                 {'choice': choices[0].pk}),
+            ]
+            self.stdout.write(f"{'setup':<24} {'user':<6} " + " ".join(
+                f"{name:>7}" for name, _, _, _ in views))
+            for name, engine, storage in SETUPS:
+                with override_settings(SESSION_ENGINE=engine,
+                                       MESSAGE_STORAGE=storage):
+                    cache.clear()
+                    for label, client in self.clients(user):
+                        counts = [self.count(client, method, url, data)
+                                  for _, method, url, data in views
+                                  if label == 'login' or method == 'get']
+                        self.stdout.write(f"{name:<24} {label:<6} " + " ".join(
+                            f"{count:>7}" for count in counts))
+
+    @staticmethod
+    def clients(user):
+        """Return an anonymous and a logged in client."""
+        anonymous = Client()
+        logged_in = Client()
+        logged_in.login(username=user.username, password="password")
+        return [('anon', anonymous), ('login', logged_in)]
+
+    @staticmethod
+    def count(client, method, url, data):
+        """Return the queries of the second of two same requests."""
+        getattr(client, method)(url, data)
+        with CaptureQueriesContext(connection) as queries:
+            getattr(client, method)(url, data)
+        return len(queries)
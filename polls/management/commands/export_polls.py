@@ -0,0 +1,74 @@
+"""Stream questions, choices or votes out as CSV or NDJSON."""
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from polls import exports
+from polls.models import Question
+
+
+def parse_moment(value):
+    """Return the aware datetime of an ISO date or datetime argument."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    """Export one kind of rows without loading the tables into memory."""
+
+    help = "Export questions, choices or votes as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(exports.FIELDS))
+        parser.add_argument('--format', choices=exports.FORMATS,
+                            default='csv', dest='output_format')
+        parser.add_argument('--output', help="File to write, default stdout.")
+        parser.add_argument('--question', type=int, action='append',
+                            dest='question_ids',
+                            help="Only this question, may be repeated.")
+        parser.add_argument('--status',
+                            choices=['published', 'open', 'closed',
+                                     'upcoming'])
+        parser.add_argument('--since', type=parse_moment,
+                            help="Only questions published at or after it.")
+        parser.add_argument('--before', type=parse_moment,
+                            help="Only questions published before it.")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Rows fetched from the database at once.")
+
+    def handle(self, *args, **options):
+        questions = Question.objects.all()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+        if options['status']:
+            questions = questions.status(options['status'])
+        if options['since']:
+            questions = questions.filter(pub_date__gte=options['since'])
+        if options['before']:
+            questions = questions.filter(pub_date__lt=options['before'])
+        lines = exports.stream_rows(options['kind'], questions,
+                                    options['output_format'],
+                                    options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as output:
+                count = 0
+                for line in lines:
+                    output.write(line)
+                    count += 1
+            if options['output_format'] == 'csv':
+                # without the header line
+                count -= 1
+            self.stdout.write(f"exported {count} {options['kind']} to "
+                              f"{options['output']}")
+        else:
+            # every line already ends with a newline
+            for line in lines:
+                self.stdout.write(line)
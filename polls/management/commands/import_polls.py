@@ -0,0 +1,55 @@
+"""Bulk import users, questions, choices and votes."""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from polls import imports
+
+
+class Command(BaseCommand):
+    """
+    Import JSON fixtures, NDJSON or CSV files in one transaction.
+
+    Give all related files in one run, in the order they refer to each
+    other, e.g. ``import_polls users.json polls.json``. Flat rows, like
+    those of ``export_polls``, need their kind: ``votes=votes.csv``.
+    """
+
+    help = "Bulk import users, questions, choices and votes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', metavar='[kind=]file',
+                            help="kind is one of "
+                                 f"{', '.join(imports.KINDS)}.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Validate and write everything, then roll "
+                                 "the transaction back.")
+
+    def handle(self, *args, **options):
+        sources = []
+        for argument in options['files']:
+            kind, _, path = argument.rpartition('=')
+            if kind and kind not in imports.KINDS:
+                raise CommandError(f"Unknown kind: {kind}")
+            sources.append((kind or None, path))
+        importer = imports.Importer(options['batch_size'])
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                for kind, path in sources:
+                    for record in imports.read_records(path, kind):
+                        importer.add(*record)
+                counts = importer.finish()
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except (OSError, ValueError, KeyError, IntegrityError) as error:
+            raise CommandError(f"Import failed, nothing was written: {error}")
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        for label, count in counts.items():
+            if count:
+                self.stdout.write(f"{label}: {count}")
+        action = "validated" if options['dry_run'] else "imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {total} rows in {elapsed:.2f}s "
+            f"({total / elapsed if elapsed else 0:.0f} rows/s)"))
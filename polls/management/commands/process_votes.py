@@ -0,0 +1,44 @@
+"""Drain the write-behind vote queue."""
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from polls import ingest
+
+logger = logging.getLogger("polls")
+
+
+class Command(BaseCommand):
+    """Apply queued votes in batched transactions until stopped."""
+
+    help = "Write queued votes to the database, last vote of a user wins."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Stop when the queue is empty.")
+        parser.add_argument('--status', action='store_true',
+                            help="Only report queue depth and lag.")
+
+    def handle(self, *args, **options):
+        queue = ingest.get_queue()
+        if options['status']:
+            self.stdout.write(f"depth={queue.depth()} "
+                              f"lag={queue.lag():.3f}s")
+            return
+        total = 0
+        while True:
+            taken, applied, lag = ingest.drain(queue, options['batch_size'])
+            if taken:
+                total += applied
+                logger.info("applied %d of %d queued votes, depth=%d, "
+                            "lag=%.3fs", applied, taken, queue.depth(), lag)
+                continue
+            if options['once']:
+                break
+            # give the connection back while idle
+            connection.close()
+            time.sleep(options['interval'])
+        self.stdout.write(f"applied {total} vote(s), depth={queue.depth()}")
@@ -0,0 +1,44 @@
+"""Create student accounts from a roster CSV."""
+import itertools
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from polls import accounts
+
+
+class Command(BaseCommand):
+    """Hash the passwords of a roster across processes and add the users."""
+
+    help = ("Create the accounts of a roster CSV with username, password, "
+            "email, first_name and last_name columns.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help="Path of the roster CSV.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Processes hashing passwords, one per core "
+                                 "by default.")
+        parser.add_argument('--chunk-size', type=int, default=50,
+                            help="Passwords hashed per task.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Accounts written per insert.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = accounts.read_roster(options['roster'])
+        try:
+            with accounts.Provisioner(options['workers'],
+                                      options['chunk_size']) as provisioner:
+                while True:
+                    batch = list(itertools.islice(rows,
+                                                  options['batch_size']))
+                    if not batch:
+                        break
+                    provisioner.add(batch)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"provisioned {provisioner.created} user(s), skipped "
+            f"{provisioner.skipped} existing, in {elapsed:.1f}s "
+            f"({provisioner.created / elapsed:.1f} accounts/s on "
+            f"{options['workers']} worker(s))."))
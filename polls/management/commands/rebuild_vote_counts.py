@@ -0,0 +1,35 @@
+"""Verify or rebuild the denormalized vote counters."""
+from django.core.management.base import BaseCommand, CommandError
+from polls import counters
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    """Compare every choice counter with the Vote table and repair drift."""
+
+    help = ("Verify or rebuild the vote counters of choices from the Vote "
+            "table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only check choices of these questions.")
+        parser.add_argument('--check', action='store_true',
+                            help="Report drift without repairing it, "
+                                 "exit with an error if any is found.")
+
+    def handle(self, *args, **options):
+        choices = Choice.objects.all()
+        if options['question_ids']:
+            choices = choices.filter(question_id__in=options['question_ids'])
+        drifted = counters.find_drift(choices)
+        for choice in drifted:
+            self.stdout.write(f"choice {choice.pk} ({choice.choice_text}): "
+                              f"counter {choice.counter}, "
+                              f"actual {choice.num_votes}")
+        if options['check'] and drifted:
+            raise CommandError(f"{len(drifted)} vote counter(s) drifted.")
+        if not options['check']:
+            counters.repair(drifted)
+        action = "found" if options['check'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(drifted)} drifted counter(s) {action}."))
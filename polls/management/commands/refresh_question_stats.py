@@ -0,0 +1,40 @@
+"""Refresh or rebuild the precomputed question statistics."""
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from polls import stats
+
+logger = logging.getLogger("polls")
+
+
+class Command(BaseCommand):
+    """Refresh the stale statistics, or rebuild all of them with --full."""
+
+    help = "Refresh the statistics of questions changed since last time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Rebuild every question from the Vote "
+                                 "table.")
+        parser.add_argument('--interval', type=float,
+                            help="Keep refreshing every this many seconds.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['full']:
+            count = stats.rebuild(options['batch_size'])
+            self.stdout.write(f"rebuilt the statistics of {count} "
+                              f"question(s)")
+            return
+        while True:
+            count = stats.refresh_stale(options['batch_size'])
+            if options['interval'] is None:
+                break
+            if count:
+                logger.info("refreshed the statistics of %d question(s)",
+                            count)
+            # give the connection back while idle
+            connection.close()
+            time.sleep(options['interval'])
+        self.stdout.write(f"refreshed the statistics of {count} question(s)")
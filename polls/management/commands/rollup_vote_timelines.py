@@ -0,0 +1,29 @@
+"""Store the vote buckets of closed polls."""
+from django.core.management.base import BaseCommand
+from polls import timeline
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    """Roll the votes of closed polls up into minute and hour buckets."""
+
+    help = "Store the timeline buckets of closed polls changed since."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Roll these questions up, closed or not, "
+                                 "archived ones keep their buckets.")
+
+    def handle(self, *args, **options):
+        if options['question_ids']:
+            questions = Question.objects.filter(
+                pk__in=options['question_ids'], archived_at__isnull=True)
+        else:
+            questions = timeline.pending_rollups()
+        rolled = 0
+        for question in list(questions.order_by('pk')):
+            buckets = timeline.rollup(question)
+            rolled += 1
+            self.stdout.write(f"question {question.pk}: {buckets} bucket(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"rolled up {rolled} question(s)."))
@@ -0,0 +1,27 @@
+"""Copy the SQLite primary database over its local replica."""
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from polls import replication
+
+
+class Command(BaseCommand):
+    """Replicate the primary database file, once or periodically."""
+
+    help = "Copy the SQLite primary over the replica, a replication stand-in."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Keep copying every this many seconds, "
+                                 "the lag of the replica.")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                path = replication.sync_replica()
+            except ImproperlyConfigured as error:
+                raise CommandError(error)
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f"replica {path} is up to date")
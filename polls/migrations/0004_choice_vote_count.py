@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_vote_count(apps, schema_editor):
+    """Count the existing votes of every choice into its counter."""
+    Choice = apps.get_model("polls", "Choice")
+    choices = list(Choice.objects.annotate(num_votes=Count("vote")))
+    for choice in choices:
+        choice.vote_count = choice.num_votes
+    Choice.objects.bulk_update(choices, ["vote_count"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0003_alter_question_end_date_vote"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="choice",
+            name="vote_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="question",
+            name="end_date",
+            field=models.DateTimeField(
+                blank=True, default=None, null=True, verbose_name="End date"
+            ),
+        ),
+        migrations.RunPython(fill_vote_count, migrations.RunPython.noop),
+    ]
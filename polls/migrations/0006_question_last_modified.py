@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_counter_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, help_text='Changed by every vote, used to answer conditional GET.', verbose_name='Last modified'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_vote_question(apps, schema_editor):
+    """Copy the question of every vote and keep one vote per question.
+
+    When a user has several votes on the same question, the newest one
+    is kept and the choice counters are recounted.
+    """
+    Choice = apps.get_model("polls", "Choice")
+    ChoiceCounterShard = apps.get_model("polls", "ChoiceCounterShard")
+    Vote = apps.get_model("polls", "Vote")
+    Vote.objects.update(
+        question_id=Subquery(
+            Choice.objects.filter(pk=OuterRef("choice_id")).values("question_id")
+        )
+    )
+    duplicated = (
+        Vote.objects.values("user_id", "question_id")
+        .annotate(count=Count("pk"), newest=Max("pk"))
+        .filter(count__gt=1)
+    )
+    for group in duplicated:
+        Vote.objects.filter(
+            user_id=group["user_id"], question_id=group["question_id"]
+        ).exclude(pk=group["newest"]).delete()
+    if duplicated:
+        choices = list(Choice.objects.annotate(num_votes=Count("vote")))
+        for choice in choices:
+            choice.vote_count = choice.num_votes
+        Choice.objects.bulk_update(choices, ["vote_count"], batch_size=500)
+        ChoiceCounterShard.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0006_question_last_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="polls.question",
+            ),
+        ),
+        migrations.RunPython(fill_vote_question, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="polls.question"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="vote",
+            constraint=models.UniqueConstraint(
+                fields=("user", "question"), name="unique_vote_per_question"
+            ),
+        ),
+    ]
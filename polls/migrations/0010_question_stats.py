@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_question_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='polls.question')),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+                ('eligible_voters', models.PositiveIntegerField(default=0, help_text='Active users when the figures were computed.')),
+                ('margin', models.PositiveIntegerField(default=0, help_text='Votes between the leading choice and the next.')),
+                ('votes_per_hour', models.FloatField(default=0.0)),
+                ('refreshed_at', models.DateTimeField(verbose_name='Refreshed at')),
+                ('leading_choice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='polls.choice')),
+            ],
+            options={
+                'verbose_name_plural': 'question stats',
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_question_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='timeline_rolled_up_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the vote buckets of the closed poll were stored.', null=True, verbose_name='Timeline rolled up at'),
+        ),
+        # existing votes keep NULL, the time they were cast is unknown
+        migrations.AddField(
+            model_name='vote',
+            name='created_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Cast at'),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='updated_at',
+            field=models.DateTimeField(null=True, verbose_name='Changed at'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, null=True, verbose_name='Cast at'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True, verbose_name='Changed at'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['question', 'created_at'], name='vote_question_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='votebucket',
+            name='choice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='votebucket',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_buckets', to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='votebucket',
+            constraint=models.UniqueConstraint(fields=('question', 'resolution', 'start', 'choice'), name='unique_vote_bucket'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_vote_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the final tally was frozen, the counters are not rebuilt from votes after it.', null=True, verbose_name='Archived at'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Days after the end date before the votes are archived, the site default when empty.', null=True, verbose_name='Retention days'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='vote_retention',
+            field=models.CharField(blank=True, choices=[('', 'Site default'), ('keep', 'Keep the votes'), ('move', 'Move the votes to the archive table'), ('delete', 'Delete the votes')], default='', help_text='What archive_polls does with the votes once the poll is closed.', max_length=6, verbose_name='Vote retention'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedVote',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.IntegerField()),
+                ('choice_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(null=True)),
+                ('updated_at', models.DateTimeField(null=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_votes', to='polls.question')),
+            ],
+        ),
+    ]
@@ -1,22 +1,118 @@
 """All model needed in the polls app."""
 import datetime
 from django.contrib import admin
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+def status_filters(now=None):
+    """Return the filter of each poll status, same rules as ``Question``.
+
+    ``published`` follows ``is_published()``, ``open`` follows
+    ``can_vote()``, ``closed`` is published but not open, archived polls
+    included, and ``upcoming`` is not published yet.
+    """
+    if now is None:
+        now = timezone.now()
+    return {
+        'published': Q(pub_date__lte=now),
+        'open': (Q(end_date__isnull=True, pub_date__lt=now,
+                   archived_at__isnull=True)
+                 | Q(pub_date__lte=now, end_date__gte=now,
+                     archived_at__isnull=True)),
+        'closed': (Q(end_date__isnull=True, pub_date=now)
+                   | Q(pub_date__lte=now, end_date__lt=now)
+                   | Q(pub_date__lte=now, archived_at__isnull=False)),
+        'upcoming': Q(pub_date__gt=now),
+    }
+
+
+class QuestionQuerySet(models.QuerySet):
+    """QuerySet of questions which filters the poll status in SQL."""
+
+    def status(self, name, now=None):
+        """Filter the questions with one of the ``status_filters()``."""
+        return self.filter(status_filters(now)[name])
+
+    def published(self, now=None):
+        """Return questions shown on the index page."""
+        return self.status('published', now)
+
+    def open_for_voting(self, now=None):
+        """Return questions allowing visitors for voting."""
+        return self.status('open', now)
+
+    def closed(self, now=None):
+        """Return published questions which do not allow voting anymore."""
+        return self.status('closed', now)
+
+    def upcoming(self, now=None):
+        """Return questions which are not published yet."""
+        return self.status('upcoming', now)
+
+
 class Question(models.Model):
     """Model for Question, including question text, publish date, and end date."""
 
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('End date', default=None, blank=True, null=True)
+    last_modified = models.DateTimeField(
+        'Last modified', auto_now=True,
+        help_text='Changed by every vote, used to answer conditional GET.')
+    counter_shards = models.PositiveSmallIntegerField(
+        'Counter shards', default=1,
+        help_text='Split each vote counter into this many rows to spread '
+                  'write contention on popular polls.')
+    timeline_rolled_up_at = models.DateTimeField(
+        'Timeline rolled up at', null=True, blank=True, editable=False,
+        help_text='When the vote buckets of the closed poll were stored.')
+    RETENTION_CHOICES = [
+        ('', 'Site default'),
+        ('keep', 'Keep the votes'),
+        ('move', 'Move the votes to the archive table'),
+        ('delete', 'Delete the votes'),
+    ]
+    vote_retention = models.CharField(
+        'Vote retention', max_length=6, choices=RETENTION_CHOICES,
+        blank=True, default='',
+        help_text='What archive_polls does with the votes once the poll '
+                  'is closed.')
+    retention_days = models.PositiveIntegerField(
+        'Retention days', null=True, blank=True,
+        help_text='Days after the end date before the votes are archived, '
+                  'the site default when empty.')
+    archived_at = models.DateTimeField(
+        'Archived at', null=True, blank=True, editable=False,
+        help_text='When the final tally was frozen, the counters are not '
+                  'rebuilt from votes after it.')
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pages of the index ordered by (pub_date, id)
+            models.Index(fields=['pub_date', 'id'],
+                         name='question_pub_id_idx'),
+            # open and closed polls with pub_date <= now <= end_date
+            models.Index(fields=['pub_date', 'end_date'],
+                         name='question_pub_end_idx'),
+            # next poll to close, for the version of the index pages
+            models.Index(fields=['end_date'], name='question_end_idx'),
+        ]
 
     def __str__(self):
         """Return the output as string for question object."""
         return self.question_text
 
+    @classmethod
+    def touch(cls, question_id):
+        """Set ``last_modified`` of a question to now without loading it."""
+        cls.objects.filter(pk=question_id).update(last_modified=timezone.now())
+
     @admin.display(
         boolean=True,
         ordering='pub_date',
@@ -33,12 +129,69 @@ class Question(models.Model):
         return self.pub_date <= now
 
     def can_vote(self):
-        """Check that question is allowing visitors for voting."""
+        """Check that question is allowing visitors for voting.
+
+        An archived question never is, its tally is frozen.
+        """
+        if self.archived_at is not None:
+            return False
         now = timezone.now()
         if self.end_date is None:
             return self.pub_date < now
         return self.pub_date <= now <= self.end_date
 
+    def tally(self):
+        """Return every choice of this question with its votes and percentage.
+
+        All vote amounts come from the choice counters and their shards in
+        one query, each returned choice carries ``num_votes`` and
+        ``percentage`` attributes.
+
+        Returns:
+            list[Choice]: choices of this question ordered by id.
+        """
+        return self._with_percentage(
+            list(self.choice_set.with_counters().order_by('pk')))
+
+    async def atally(self):
+        """Return the same tally as ``tally()`` with the async ORM."""
+        return self._with_percentage([
+            choice async for choice
+            in self.choice_set.with_counters().order_by('pk')])
+
+    @staticmethod
+    def _with_percentage(choices):
+        """Set the ``percentage`` of every choice among all votes."""
+        total = sum(choice.num_votes for choice in choices)
+        for choice in choices:
+            choice.percentage = \
+                round(choice.num_votes * 100 / total, 1) if total else 0.0
+        return choices
+
+
+def counter_total():
+    """Return the expression of a choice counter, its column plus shards."""
+    shard_sum = ChoiceCounterShard.objects.filter(
+        choice=OuterRef('pk')
+    ).values('choice').annotate(total=Sum('count')).values('total')
+    return F('vote_count') + Coalesce(Subquery(shard_sum), 0)
+
+
+class ChoiceQuerySet(models.QuerySet):
+    """QuerySet of choices which can load vote amount in the same query."""
+
+    def with_votes(self):
+        """Annotate each choice with its exact vote amount as ``num_votes``.
+
+        The amount is counted from the ``Vote`` table, use ``vote_count``
+        for the cheap denormalized counter.
+        """
+        return self.annotate(num_votes=Count('vote'))
+
+    def with_counters(self):
+        """Annotate each choice with its counter total as ``num_votes``."""
+        return self.annotate(num_votes=counter_total())
+
 
 class Choice(models.Model):
     """Model for Choice, including question, choice_text, and votes."""
@@ -46,32 +199,173 @@ class Choice(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
     # votes = models.IntegerField(default=0)
+    vote_count = models.IntegerField(default=0)
+
+    objects = ChoiceQuerySet.as_manager()
 
     @property
     def votes(self) -> int:
         """Return votes amount of that choice.
 
+        Use the amount loaded by ``with_votes()`` or ``with_counters()``
+        when it exists, otherwise read the counter from the database.
+
         Returns:
             int: votes amount
         """
-        return Vote.objects.filter(choice=self).count()
+        if 'num_votes' in self.__dict__:
+            return self.num_votes
+        return Choice.objects.with_counters().get(pk=self.pk).num_votes
 
     def __str__(self):
         """Return the output as string for choice object."""
         return self.choice_text
 
 
+class ChoiceCounterShard(models.Model):
+    """Extra counter row of a choice, used when its question is sharded.
+
+    The vote amount of a choice is its ``vote_count`` plus the sum of all
+    its shards, so a vote may be added to or taken from any of them.
+    """
+
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE,
+                               related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'],
+                                    name='unique_choice_counter_shard'),
+        ]
+
+
 class Vote(models.Model):
-    """Model for votes of question."""
+    """Model for votes of question, one vote per user and question."""
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    # unknown for the votes cast before they were recorded
+    created_at = models.DateTimeField('Cast at', default=timezone.now,
+                                      null=True, editable=False)
+    updated_at = models.DateTimeField('Changed at', auto_now=True,
+                                      null=True)
 
-    @property
-    def question(self) -> Question:
-        """Return the question holding this vote.
+    class Meta:
+        constraints = [
+            # also the index of the (user, question) lookup of a vote
+            models.UniqueConstraint(fields=['user', 'question'],
+                                    name='unique_vote_per_question'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'choice'],
+                         name='vote_user_choice_idx'),
+            # time buckets of the votes of a question
+            models.Index(fields=['question', 'created_at'],
+                         name='vote_question_created_idx'),
+        ]
 
-        Returns:
-            Question: question of this vote.
+    # choice id as loaded from the database, to move the counter on change
+    _loaded_choice_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored choice of a vote loaded from the database."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_choice_id = instance.__dict__.get('choice_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save the vote and update the choice counters atomically.
+
+        The question is taken from the choice when it is not given.
         """
-        return self.choice.question
+        from . import counters, results_cache
+        if self.question_id is None:
+            self.question = self.choice.question
+        # join the transaction of update_or_create() without a savepoint
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            counters.record_vote(self._loaded_choice_id, self.choice_id,
+                                 shards=self.choice.question.counter_shards)
+            results_cache.invalidate(self.question_id)
+            Question.touch(self.question_id)
+        self._loaded_choice_id = self.choice_id
+
+
+class QuestionStats(models.Model):
+    """Precomputed statistics of a question, kept up to date by ``stats``.
+
+    The figures are stale when the question changed after
+    ``refreshed_at``.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True, related_name='stats')
+    total_votes = models.PositiveIntegerField(default=0)
+    eligible_voters = models.PositiveIntegerField(
+        default=0, help_text='Active users when the figures were computed.')
+    leading_choice = models.ForeignKey(Choice, on_delete=models.SET_NULL,
+                                       null=True, blank=True,
+                                       related_name='+')
+    margin = models.PositiveIntegerField(
+        default=0, help_text='Votes between the leading choice and the next.')
+    votes_per_hour = models.FloatField(default=0.0)
+    refreshed_at = models.DateTimeField('Refreshed at')
+
+    class Meta:
+        verbose_name_plural = 'question stats'
+
+    def __str__(self):
+        """Return the question of the statistics."""
+        return f"Statistics of {self.question_id}"
+
+    @property
+    def turnout(self):
+        """Return the percentage of eligible voters who voted."""
+        if not self.eligible_voters:
+            return 0.0
+        return round(self.total_votes * 100 / self.eligible_voters, 1)
+
+
+class VoteBucket(models.Model):
+    """Votes of a choice cast in one minute or hour of a closed poll.
+
+    Stored by ``timeline.rollup()`` so the timeline of a closed poll is
+    read from its buckets instead of its votes.
+    """
+
+    RESOLUTIONS = [('minute', 'Minute'), ('hour', 'Hour')]
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE,
+                                 related_name='vote_buckets')
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE,
+                               related_name='+')
+    resolution = models.CharField(max_length=6, choices=RESOLUTIONS)
+    start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['question', 'resolution', 'start', 'choice'],
+                name='unique_vote_bucket'),
+        ]
+
+
+class ArchivedVote(models.Model):
+    """A vote of an archived poll, moved out of the ``Vote`` table.
+
+    Only the question keeps a foreign key, the other ids are plain
+    columns so the archive has no index to maintain but its own.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE,
+                                 related_name='archived_votes')
+    user_id = models.IntegerField()
+    choice_id = models.BigIntegerField()
+    created_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(null=True)
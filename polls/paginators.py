@@ -0,0 +1,99 @@
+"""Paginator for admin changelists of large tables.
+
+``COUNT(*)`` reads the whole table or index on SQLite and PostgreSQL, so a
+changelist of a million votes would spend most of its time counting. The
+unfiltered count is estimated instead, and a filtered count stops at
+``POLLS_ADMIN_COUNT_LIMIT`` rows.
+
+The estimates come from the table statistics, which ``refresh_estimates()``
+brings up to date after many rows were deleted.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def count_limit():
+    """Return the amount of rows a filtered changelist counts at most."""
+    return getattr(settings, 'POLLS_ADMIN_COUNT_LIMIT', 10_000)
+
+
+def estimate_count(queryset):
+    """Return an estimate of the rows of the table of a queryset.
+
+    Returns:
+        int or None: the estimate, None when the database has none.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class "
+                           "WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # -1 or 0 when the table was never analyzed
+            return row[0] if row and row[0] > 0 else None
+        if connection.vendor == 'sqlite':
+            # the row count of the last ANALYZE, unlike the largest id it
+            # goes down once deleted rows are analyzed
+            try:
+                cursor.execute("SELECT stat FROM sqlite_stat1 "
+                               "WHERE tbl = %s", [model._meta.db_table])
+            except DatabaseError:
+                # never analyzed, no statistics table
+                return None
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+def refresh_estimates(*models, using='default'):
+    """Update the statistics the estimates of the tables of models read."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in models:
+            table = connection.ops.quote_name(model._meta.db_table)
+            cursor.execute(f"ANALYZE {table}")
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts more than ``count_limit()`` rows.
+
+    The amount of an unfiltered list is estimated from the table, a
+    filtered list is counted up to the limit.
+    """
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        """Return the estimated or capped amount of objects."""
+        queryset = self.object_list
+        limit = count_limit()
+        if not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate > limit:
+                self.estimated = True
+                return estimate
+        return self.capped_count()
+
+    def capped_count(self):
+        """Return the amount of objects, counted up to the limit."""
+        return self.object_list.order_by()[:count_limit()].count()
+
+    def page(self, number):
+        """
+        Return a page, counting again when the estimate promised more
+        rows than the table has.
+        """
+        page = super().page(number)
+        # the rows of the page are loaded once, the changelist reuses them
+        if self.estimated and page.number > 1 and not page.object_list:
+            self.estimated = False
+            self.__dict__['count'] = self.capped_count()
+            self.__dict__.pop('num_pages', None)
+            page = super().page(number)
+        return page
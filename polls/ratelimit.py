@@ -0,0 +1,149 @@
+"""Token bucket rate limits of the vote and signup views.
+
+Every client key, the logged in user or the IP address, has a bucket of
+``capacity`` tokens refilled evenly over ``period`` seconds. A request
+takes one token from each bucket of its keys, or is answered with 429 Too
+Many Requests and ``Retry-After`` when one of them is empty.
+
+A bucket is one ``(tokens, time)`` entry of the cache, which expires once
+the bucket would be full again. The user comes from the session, not from
+the database, so a rejected request never queries it with cached or
+cookie sessions. The IP address is the one that connected, or the one
+the outermost of ``POLLS_TRUSTED_PROXIES`` proxies saw, never a value
+the client wrote itself.
+
+A bucket is read and written back without a lock, which the cache API
+does not offer, so requests of one key racing each other may spend the
+same token: a burst of concurrent requests can pass a few over the
+limit. The limits are a throttle, not an exact quota.
+"""
+import asyncio
+import functools
+import math
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.http import HttpResponse
+
+KEY = 'polls:ratelimit:{}:{}:{}'
+
+
+def get_limits(scope):
+    """Return the ``{key kind: (capacity, period)}`` limits of a scope.
+
+    ``POLLS_RATE_LIMITS`` gives them as ``"capacity/seconds"`` strings,
+    an empty string turns a limit off.
+    """
+    limits = {}
+    for kind, rate in getattr(settings, 'POLLS_RATE_LIMITS', {}).get(
+            scope, {}).items():
+        if rate:
+            capacity, period = rate.split('/')
+            limits[kind] = (int(capacity), float(period))
+    return limits
+
+
+def get_client_ip(request):
+    """Get the visitor’s IP address, as seen by the trusted proxies.
+
+    Each of the ``POLLS_TRUSTED_PROXIES`` proxies appends the address it
+    was connected from to ``X-Forwarded-For``, so the client address is
+    that many hops from the right; the hops further left are written by
+    the client. Without trusted proxies the header is ignored.
+    """
+    trusted = getattr(settings, 'POLLS_TRUSTED_PROXIES', 0)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if trusted and x_forwarded_for:
+        hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+        return hops[-min(trusted, len(hops))]
+    return request.META.get('REMOTE_ADDR')
+
+
+def client_keys(request, kinds):
+    """Return the value of every key kind of a request, None if unknown."""
+    keys = {}
+    if 'user' in kinds:
+        # the session of a cookie or the cache, the user is not loaded
+        keys['user'] = request.session.get(SESSION_KEY)
+    if 'ip' in kinds:
+        keys['ip'] = get_client_ip(request)
+    return keys
+
+
+def take(scope, keys, limits, now=None):
+    """Take one token from the bucket of every key.
+
+    Nothing is taken when a bucket is empty.
+
+    Returns:
+        float: 0 when the tokens were taken, else the seconds until the
+        emptiest bucket has a token again.
+    """
+    now = now or time.time()
+    names = {KEY.format(scope, kind, value): limits[kind]
+             for kind, value in keys.items() if value is not None}
+    buckets = cache.get_many(names)
+    updates = {}
+    wait = 0.0
+    for name, (capacity, period) in names.items():
+        rate = capacity / period
+        tokens, stamp = buckets.get(name, (capacity, now))
+        tokens = min(capacity, tokens + (now - stamp) * rate)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / rate)
+        updates[name] = (tokens - 1, now, (capacity - tokens + 1) / rate)
+    if wait:
+        return wait
+    for name, (tokens, stamp, refill) in updates.items():
+        # gone once full again, a missing bucket is a full one
+        cache.set(name, (tokens, stamp), math.ceil(refill))
+    return 0.0
+
+
+def too_many_requests(wait):
+    """Return the 429 response asking to retry after ``wait`` seconds."""
+    retry_after = max(1, math.ceil(wait))
+    response = HttpResponse(
+        f"Too many requests, try again in {retry_after} seconds.",
+        status=429, content_type='text/plain')
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def check(request, scope, methods):
+    """Return the 429 response of a limited request, None if allowed."""
+    if methods and request.method not in methods:
+        return None
+    limits = get_limits(scope)
+    if not limits:
+        return None
+    wait = take(scope, client_keys(request, limits), limits)
+    return too_many_requests(wait) if wait else None
+
+
+def rate_limit(scope, methods=None):
+    """
+    Decorate a view, sync or async, with the limits of ``scope`` in
+    ``POLLS_RATE_LIMITS``, for the given HTTP methods or all of them.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response = await sync_to_async(check)(request, scope,
+                                                      methods)
+                if response is not None:
+                    return response
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = check(request, scope, methods)
+            if response is not None:
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
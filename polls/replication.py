@@ -0,0 +1,37 @@
+"""Stand-in replication of a SQLite primary to its replica file.
+
+PostgreSQL replicas are kept by streaming replication. To try the replica
+router with SQLite, ``manage.py sync_replica`` copies the primary file
+over the replica with the SQLite backup API, a consistent snapshot even
+while votes are written.
+"""
+import sqlite3
+from contextlib import closing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from . import routers
+
+
+def copy_database(source, target):
+    """Copy the SQLite database file ``source`` over ``target``."""
+    with closing(sqlite3.connect(source)) as primary, \
+            closing(sqlite3.connect(target)) as replica:
+        primary.backup(replica)
+
+
+def sync_replica():
+    """Copy the primary database over the replica database.
+
+    Returns:
+        str: the path of the replica.
+    """
+    alias = routers.replica_alias()
+    if alias is None or alias == DEFAULT_DB_ALIAS:
+        raise ImproperlyConfigured("No replica database is configured.")
+    primary = connections[DEFAULT_DB_ALIAS]
+    replica = connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ImproperlyConfigured("Only SQLite replicas can be synced.")
+    copy_database(primary.settings_dict['NAME'],
+                  replica.settings_dict['NAME'])
+    return replica.settings_dict['NAME']
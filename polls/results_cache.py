@@ -0,0 +1,168 @@
+"""Versioned cache of poll results.
+
+The tally of a question is cached together with the version it was built
+for. Writing a vote or editing a choice bumps the version of the question,
+which makes the cached tally stale. A stale tally is still served for at
+most ``POLLS_RESULTS_MAX_STALENESS`` seconds while one request rebuilds it,
+so a popular poll never recomputes the same tally many times at once.
+"""
+import asyncio
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from . import routers
+
+VERSION_KEY = 'polls:results:version:{}'
+CHANGED_KEY = 'polls:results:changed:{}'
+ENTRY_KEY = 'polls:results:entry:{}'
+LOCK_KEY = 'polls:results:lock:{}'
+
+
+class Tally(list):
+    """List of choices returned by ``get_tally()``.
+
+    ``stale`` is True when the tally was served while being rebuilt.
+    """
+
+    stale = False
+
+
+def max_staleness():
+    """Return how many seconds a stale tally may still be served."""
+    return getattr(settings, 'POLLS_RESULTS_MAX_STALENESS', 2)
+
+
+def lock_timeout():
+    """Return how many seconds a rebuild may hold the lock."""
+    return getattr(settings, 'POLLS_RESULTS_LOCK_TIMEOUT', 5)
+
+
+def _bump(question_id):
+    """Increase the version of a question and remember when it changed."""
+    key = VERSION_KEY.format(question_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # start from the clock so a lost version key never goes back
+        cache.add(key, time.time_ns(), None)
+    cache.set(CHANGED_KEY.format(question_id), time.time(), None)
+
+
+def invalidate(question_id):
+    """Mark the cached tally of a question as stale.
+
+    The version is bumped right away and again after the transaction
+    commits, so a tally rebuilt from uncommitted data is not kept.
+    """
+    _bump(question_id)
+    transaction.on_commit(lambda: _bump(question_id))
+
+
+def get_version(question_id):
+    """Return the current version of the results of a question."""
+    key = VERSION_KEY.format(question_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_tally(question):
+    """Return the tally of a question, from the cache when possible.
+
+    Args:
+        question: the question whose ``tally()`` is cached.
+
+    Returns:
+        Tally: the choices of ``Question.tally()``.
+    """
+    version = get_version(question.pk)
+    entry_key = ENTRY_KEY.format(question.pk)
+    entry = cache.get(entry_key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    lock_key = LOCK_KEY.format(question.pk)
+    deadline = time.monotonic() + lock_timeout()
+    while not cache.add(lock_key, True, lock_timeout()):
+        # another request is rebuilding, serve the stale tally if allowed
+        changed = cache.get(CHANGED_KEY.format(question.pk), 0)
+        if entry is not None and time.time() - changed <= max_staleness():
+            tally = Tally(entry[1])
+            tally.stale = True
+            return tally
+        if time.monotonic() >= deadline:
+            return Tally(question.tally())
+        time.sleep(0.05)
+        entry = cache.get(entry_key)
+        if entry is not None and entry[0] == get_version(question.pk):
+            return entry[1]
+    try:
+        # a lagging replica would keep an old tally under the new version
+        with routers.primary():
+            tally = Tally(question.tally())
+        cache.set(entry_key, (version, tally))
+    finally:
+        cache.delete(lock_key)
+    return tally
+
+
+def peek_tallies(question_ids):
+    """Return the cached tallies that are current, without rebuilding any.
+
+    Args:
+        question_ids: ids of the questions to look up.
+
+    Returns:
+        dict: ``Tally`` by question id, missing and stale ones left out.
+    """
+    keys = {pk: (VERSION_KEY.format(pk), ENTRY_KEY.format(pk))
+            for pk in question_ids}
+    found = cache.get_many([key for pair in keys.values() for key in pair])
+    tallies = {}
+    for pk, (version_key, entry_key) in keys.items():
+        entry = found.get(entry_key)
+        if entry is not None and entry[0] == found.get(version_key):
+            tallies[pk] = entry[1]
+    return tallies
+
+
+async def aget_version(question_id):
+    """Return the same version as ``get_version()`` with the async cache."""
+    key = VERSION_KEY.format(question_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+async def aget_tally(question):
+    """Return the same tally as ``get_tally()`` for async views."""
+    version = await aget_version(question.pk)
+    entry_key = ENTRY_KEY.format(question.pk)
+    entry = await cache.aget(entry_key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    lock_key = LOCK_KEY.format(question.pk)
+    deadline = time.monotonic() + lock_timeout()
+    while not await cache.aadd(lock_key, True, lock_timeout()):
+        changed = await cache.aget(CHANGED_KEY.format(question.pk), 0)
+        if entry is not None and time.time() - changed <= max_staleness():
+            tally = Tally(entry[1])
+            tally.stale = True
+            return tally
+        if time.monotonic() >= deadline:
+            return Tally(await question.atally())
+        await asyncio.sleep(0.05)
+        entry = await cache.aget(entry_key)
+        if entry is not None and entry[0] == await aget_version(question.pk):
+            return entry[1]
+    try:
+        with routers.primary():
+            tally = Tally(await question.atally())
+        await cache.aset(entry_key, (version, tally))
+    finally:
+        await cache.adelete(lock_key)
+    return tally
@@ -0,0 +1,90 @@
+"""Database router sending the reads of the polls pages to a replica.
+
+Reads of polls models go to the ``POLLS_REPLICA_DATABASE`` alias only
+inside ``replica_reads()``, which the read-only views enter. Writes, and
+the reads of votes, commands and every other view, stay on the primary.
+
+A user who just voted carries the ``polls_primary`` cookie for
+``POLLS_REPLICA_STICKY_SECONDS``, so the following pages read the primary
+and show the vote even while the replica lags behind.
+"""
+import contextvars
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = 'polls_primary'
+
+# a context variable follows the request into sync_to_async() threads
+_replica_reads = contextvars.ContextVar('polls_replica_reads',
+                                        default=False)
+
+
+def replica_alias():
+    """Return the alias of the replica, None when there is none."""
+    return getattr(settings, 'POLLS_REPLICA_DATABASE', None)
+
+
+def sticky_seconds():
+    """Return how long a voter reads the primary after voting."""
+    return getattr(settings, 'POLLS_REPLICA_STICKY_SECONDS', 10)
+
+
+def read_alias():
+    """Return the alias polls reads go to now, None for the primary."""
+    return replica_alias() if _replica_reads.get() else None
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Send the polls reads inside the block to the replica, if enabled."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def primary():
+    """Send the polls reads inside the block to the primary."""
+    return replica_reads(False)
+
+
+def is_sticky(request):
+    """Return True when the user of the request voted a moment ago."""
+    return STICKY_COOKIE in request.COOKIES
+
+
+def stick_to_primary(response):
+    """Make the next requests of the user read the primary for a while."""
+    if replica_alias() is not None:
+        response.set_cookie(STICKY_COOKIE, '1', max_age=sticky_seconds(),
+                            httponly=True, samesite='Lax')
+    return response
+
+
+class PrimaryReplicaRouter:
+    """Read polls models from the replica inside ``replica_reads()``."""
+
+    def db_for_read(self, model, **hints):
+        """Return the replica for polls reads of a read-only view."""
+        if model._meta.app_label == 'polls':
+            return read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        """Write to the primary, also objects read from the replica."""
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Relate objects of the primary and the replica, the same data."""
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Migrate the primary only, the replica copies it."""
+        if db == replica_alias() and db != DEFAULT_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,52 @@
+"""Signal receivers of polls app."""
+import contextvars
+from contextlib import contextmanager
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import counters, index_cache, results_cache
+from .models import Choice, Question, Vote
+
+
+# archived questions whose votes are purged in the current context, a
+# context variable leaves other threads and requests alone
+_archived = contextvars.ContextVar('polls_archived_questions',
+                                   default=frozenset())
+
+
+@contextmanager
+def archived(*question_ids):
+    """Keep the frozen counters of archived questions inside the block."""
+    token = _archived.set(_archived.get() | set(question_ids))
+    try:
+        yield
+    finally:
+        _archived.reset(token)
+
+
+@receiver(post_delete, sender=Vote)
+def vote_deleted(sender, instance, **kwargs):
+    """Take a deleted vote away from its choice counter.
+
+    The votes of an archived question are purged without changing its
+    frozen tally.
+    """
+    if instance.question_id in _archived.get():
+        return
+    counters.add_votes(instance.choice_id, -1)
+    results_cache.invalidate(instance.question_id)
+    Question.touch(instance.question_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    """Make the cached results stale when a choice is edited."""
+    results_cache.invalidate(instance.question_id)
+    Question.touch(instance.question_id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """Make the index pages change when a question is edited."""
+    index_cache.invalidate()
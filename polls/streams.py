@@ -0,0 +1,166 @@
+"""Live results of questions pushed to Server-Sent Events subscribers.
+
+All subscribers of a question share one watcher task per event loop. The
+watcher polls the results version in the cache, so votes written by any
+process are seen, and computes the tally once per change, no matter how
+many viewers are connected. Every subscriber gets compact deltas through
+a bounded queue; a subscriber too slow to keep up is sent one full
+snapshot instead of the deltas it missed.
+
+Django 4.2 does not stop a streaming response when its client goes away,
+so a stream ends by itself after ``POLLS_STREAM_MAX_AGE`` seconds, and
+the browser reconnects after the ``retry`` delay with a fresh snapshot.
+"""
+import asyncio
+import json
+import weakref
+from django.conf import settings
+from . import results_cache
+
+
+def poll_interval():
+    """Return the seconds between two version checks of a question."""
+    return getattr(settings, 'POLLS_STREAM_POLL_INTERVAL', 0.5)
+
+
+def heartbeat_interval():
+    """Return the seconds of silence before a heartbeat comment is sent."""
+    return getattr(settings, 'POLLS_STREAM_HEARTBEAT', 15)
+
+
+def max_age():
+    """Return the seconds after which a stream ends and is reconnected."""
+    return getattr(settings, 'POLLS_STREAM_MAX_AGE', 300)
+
+
+def format_event(name, data):
+    """Return one Server-Sent Event with a compact JSON payload."""
+    payload = json.dumps(data, separators=(',', ':'))
+    return f"event: {name}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    """Bounded queue of events for one viewer."""
+
+    def __init__(self, hub, question_id, size):
+        self.hub = hub
+        self.question_id = question_id
+        self.queue = asyncio.Queue(maxsize=size)
+
+    def push(self, event):
+        """Queue an event, or replace the backlog by a snapshot when full."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.hub.snapshot_event(self.question_id))
+
+    async def events(self):
+        """
+        Yield the events of the question, with heartbeats, until closed or
+        ``max_age()`` seconds have passed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_age()
+        try:
+            yield "retry: 3000\n\n"
+            yield self.hub.snapshot_event(self.question_id)
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    yield await asyncio.wait_for(
+                        self.queue.get(), min(heartbeat_interval(), remaining))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self.hub.unsubscribe(self)
+
+
+class TallyHub:
+    """Fan-out of the tally changes of questions to their subscribers."""
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.watchers = {}
+        self.counts = {}
+        self.versions = {}
+
+    async def subscribe(self, question):
+        """Return a new subscription to the live results of a question."""
+        if question.pk not in self.counts:
+            await self.refresh(question)
+        subscription = Subscription(self, question.pk, self.queue_size)
+        self.subscribers.setdefault(question.pk, set()).add(subscription)
+        if question.pk not in self.watchers:
+            self.watchers[question.pk] = asyncio.ensure_future(
+                self.watch(question))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Forget a subscription, stop watching a question nobody views."""
+        subscribers = self.subscribers.get(subscription.question_id, set())
+        subscribers.discard(subscription)
+        if not subscribers:
+            self.subscribers.pop(subscription.question_id, None)
+            watcher = self.watchers.pop(subscription.question_id, None)
+            if watcher is not None:
+                watcher.cancel()
+            self.counts.pop(subscription.question_id, None)
+            self.versions.pop(subscription.question_id, None)
+
+    def snapshot_event(self, question_id):
+        """Return the full tally of a question as a ``snapshot`` event."""
+        return format_event('snapshot', {
+            'v': self.versions.get(question_id),
+            'counts': self.counts.get(question_id, {}),
+        })
+
+    async def refresh(self, question):
+        """Load the tally and return the counts that changed.
+
+        Returns:
+            dict or None: changed counts by choice id, None when the
+            choices themselves changed and a snapshot is needed.
+        """
+        version = await results_cache.aget_version(question.pk)
+        tally = await results_cache.aget_tally(question)
+        # a stale tally is loaded again at the next check
+        self.versions[question.pk] = None if tally.stale else version
+        counts = {str(choice.pk): choice.num_votes for choice in tally}
+        old = self.counts.get(question.pk, {})
+        self.counts[question.pk] = counts
+        if counts.keys() != old.keys():
+            return None
+        return {pk: counts[pk] - old[pk] for pk in counts
+                if counts[pk] != old[pk]}
+
+    async def watch(self, question):
+        """Publish the tally changes of a question while it has viewers."""
+        while True:
+            await asyncio.sleep(poll_interval())
+            version = await results_cache.aget_version(question.pk)
+            if version == self.versions.get(question.pk):
+                continue
+            changed = await self.refresh(question)
+            if changed is None:
+                event = self.snapshot_event(question.pk)
+            elif changed:
+                event = format_event('delta', {
+                    'v': self.versions[question.pk], 'd': changed})
+            else:
+                continue
+            for subscription in list(self.subscribers.get(question.pk, ())):
+                subscription.push(event)
+
+
+# one hub per event loop, the asyncio objects belong to their loop
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """Return the hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = TallyHub()
+    return _hubs[loop]
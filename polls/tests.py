@@ -1,9 +1,38 @@
+import asyncio
 import datetime
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import EmptyPage
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from django.urls import reverse
-from .models import Question, Vote
+from django.utils.dateparse import parse_datetime
+from django.urls import include, path, reverse
+from mysite import db_profiles
+from mysite.hashers import ScryptPasswordHasher, password_hashers
+from mysite.sqlite_backend import base as sqlite_backend
+from . import (accounts, archive, async_views, ingest, paginators,
+               ratelimit, replication, results_cache, routers, stats,
+               streams, timeline)
+from .views import DetailView, IndexView, encode_cursor
+from .models import (ArchivedVote, Choice, ChoiceCounterShard, Question,
+                     QuestionStats, Vote)
 
 
 def create_question(question_text, days):
@@ -81,6 +110,68 @@ class QuestionIndexViewTests(TestCase):
             [question2, question1],
         )
 
+    def test_keyset_pages(self):
+        """
+        The index shows 5 questions per page and the cursor of the last
+        question leads to the older ones.
+        """
+        questions = [create_question(question_text=f"Question {index}.",
+                                     days=-index - 1) for index in range(7)]
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(list(response.context['latest_question_list']),
+                         questions[:5])
+        cursor = response.context['next_cursor']
+        response = self.client.get(reverse('polls:index'), {'after': cursor})
+        self.assertEqual(list(response.context['latest_question_list']),
+                         questions[5:])
+        self.assertNotIn('next_cursor', response.context)
+
+    def test_keyset_same_pub_date(self):
+        """Questions published at the same time are split by their id."""
+        time = timezone.now() - datetime.timedelta(days=1)
+        questions = [Question.objects.create(question_text=f"Tie {index}.",
+                                             pub_date=time)
+                     for index in range(3)]
+        response = self.client.get(reverse('polls:index'), {'size': 2})
+        self.assertEqual(list(response.context['latest_question_list']),
+                         questions[:0:-1])
+        response = self.client.get(reverse('polls:index'), {
+            'size': 2, 'after': response.context['next_cursor']})
+        self.assertEqual(list(response.context['latest_question_list']),
+                         questions[:1])
+
+    @override_settings(POLLS_INDEX_MAX_PAGE_SIZE=3)
+    def test_page_size_cap(self):
+        """A page never holds more questions than the configured cap."""
+        for index in range(5):
+            create_question(question_text=f"Question {index}.", days=-1)
+        response = self.client.get(reverse('polls:index'), {'size': 100})
+        self.assertEqual(len(response.context['latest_question_list']), 3)
+
+    def test_status_filters(self):
+        """The status filter picks open, closed or upcoming polls."""
+        now = timezone.now()
+        open_question = create_question(question_text="Open.", days=-2)
+        closed_question = Question.objects.create(
+            question_text="Closed.", pub_date=now - datetime.timedelta(days=3),
+            end_date=now - datetime.timedelta(days=1))
+        upcoming_question = create_question(question_text="Upcoming.",
+                                            days=2)
+        for status, question in (('open', open_question),
+                                 ('closed', closed_question),
+                                 ('upcoming', upcoming_question)):
+            response = self.client.get(reverse('polls:index'),
+                                       {'status': status})
+            self.assertEqual(list(response.context['latest_question_list']),
+                             [question])
+
+    def test_invalid_cursor(self):
+        """A malformed cursor or status returns 404."""
+        response = self.client.get(reverse('polls:index'), {'after': 'x'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('polls:index'), {'status': 'x'})
+        self.assertEqual(response.status_code, 404)
+
 
 class QuestionModelTests(TestCase):
 
@@ -206,53 +297,1998 @@ class QuestionDetailViewTests(TestCase):
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
 
-    class VoteTest(TestCase):
-        def setUp(self) -> None:
-            """Initialize attribute before test"""
-            self.user = User.objects.create_user(username="mymelody")
-            self.user.set_password("hackme22")
-            self.user.save()
-            self.client.login(username="mymelody", password="hackme22")
-
-        def test_vote_count(self):
-            """
-            Test that the number of votes are counted correctly.
-            """
-            question1 = create_question(question_text='Past Question.',
+    def test_missing_question(self):
+        """The detail view of a question that does not exist returns 404."""
+        response = self.client.get(reverse('polls:detail', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_selected_choice_is_checked(self):
+        """The choice the user voted for is checked by its id."""
+        question = create_question(question_text='Past Question.', days=-5)
+        question.choice_set.create(choice_text="Same text")
+        choice = question.choice_set.create(choice_text="Same text")
+        Vote.objects.create(user=self.user, choice=choice)
+        response = self.client.get(reverse('polls:detail',
+                                           args=(question.id,)))
+        self.assertEqual(response.context['selected_choice_id'], choice.id)
+        self.assertContains(response, 'checked="true"', count=1)
+        self.assertContains(response, f'value="{choice.id}"')
+
+    def test_detail_page_queries(self):
+        """
+        The detail page renders in 3 queries: the question, its choices
+        and the vote of the user, no matter how many choices it has.
+        """
+        question = create_question(question_text='Past Question.', days=-5)
+        for index in range(20):
+            question.choice_set.create(choice_text=f"Choice {index}")
+        request = RequestFactory().get(reverse('polls:detail',
+                                               args=(question.id,)))
+        request.user = self.user
+        with self.assertNumQueries(3):
+            response = DetailView.as_view()(request, pk=question.id)
+            response.render()
+        self.assertContains(response, "Choice 19")
+
+
+class VoteTest(TestCase):
+    def setUp(self) -> None:
+        """Initialize attribute before test"""
+        cache.clear()
+        self.user = User.objects.create_user(username="mymelody")
+        self.user.set_password("hackme22")
+        self.user.save()
+        self.client.login(username="mymelody", password="hackme22")
+
+    def test_vote_count(self):
+        """
+        Test that the number of votes are counted correctly.
+        """
+        question1 = create_question(question_text='Past Question.',
+                                    days=-5)
+        choice1 = question1.choice_set.create(choice_text='Correct')
+        # self.user = User.objects.create_user(username='mymelody')
+        Vote.objects.create(question=question1,
+                            choice=choice1,
+                            user=self.user)
+        self.assertEqual(1, choice1.votes)
+
+    def test_user_can_vote_one_choice_each_question(self):
+        """Test for one user one vote."""
+        question1 = create_question(question_text='Past Question.',
+                                    days=-5)
+        choice1 = question1.choice_set.create(choice_text="A lot")
+        choice2 = question1.choice_set.create(choice_text="Not at all")
+        self.client.post(reverse('polls:vote', args=(question1.id,)),
+                         {'choice': choice1.id})
+        self.assertEqual(question1.vote_set.get(user=self.user).choice,
+                         choice1)
+        self.assertEqual(Vote.objects.all().count(), 1)
+        self.client.post(reverse('polls:vote', args=(question1.id,)),
+                         {'choice': choice2.id})
+        self.assertEqual(question1.vote_set.get(user=self.user).choice,
+                         choice2)
+        self.assertEqual(Vote.objects.all().count(), 1)
+
+    def test_voter_is_authenticated(self):
+        """Test that only authenticated user can vote."""
+        question1 = create_question(question_text='Past Question.',
+                                    days=-5)
+        ans_a = self.client.post(reverse('polls:vote',
+                                         args=(question1.id,)))
+        self.assertEqual(ans_a.status_code, 200)
+        self.client.logout()
+        ans_b = self.client.post(reverse('polls:vote',
+                                         args=(question1.id,)))
+        self.assertEqual(ans_b.status_code, 302)
+
+
+class QuestionResultsViewTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question with votes before test"""
+        cache.clear()
+        self.question = create_question(question_text="Results question.",
                                         days=-5)
-            choice1 = question1.choice_set.create(choice_text='Correct')
-            # self.user = User.objects.create_user(username='mymelody')
-            Vote.objects.create(question=question1,
-                                choice=choice1,
-                                user=self.user)
-            self.assertEqual(1, choice1.votes)
-
-        def test_user_can_vote_one_choice_each_question(self):
-            """Test for one user one vote."""
-            question1 = create_question(question_text='Past Question.',
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        for index in range(3):
+            user = User.objects.create_user(username=f"voter{index}")
+            choice = self.choice1 if index < 2 else self.choice2
+            Vote.objects.create(user=user, choice=choice)
+
+    def test_tally_counts_and_percentage(self):
+        """
+        tally() returns every choice with its vote amount and percentage.
+        """
+        tally = self.question.tally()
+        self.assertEqual([c.num_votes for c in tally], [2, 1])
+        self.assertEqual([c.percentage for c in tally], [66.7, 33.3])
+
+    def test_tally_without_votes(self):
+        """
+        tally() gives zero percentage when the question has no votes.
+        """
+        question = create_question(question_text="Empty question.", days=-1)
+        question.choice_set.create(choice_text="Nobody")
+        self.assertEqual([c.percentage for c in question.tally()], [0.0])
+
+    def test_votes_uses_loaded_amount(self):
+        """
+        Choice.votes does not query again after the tally has been loaded.
+        """
+        tally = self.question.tally()
+        with self.assertNumQueries(0):
+            self.assertEqual([c.votes for c in tally], [2, 1])
+
+    def test_results_page_queries(self):
+        """
+        The results page loads the question and its tally in two queries,
+        no matter how many choices it has.
+        """
+        for index in range(20):
+            self.question.choice_set.create(choice_text=f"Extra {index}")
+        url = reverse('polls:results', args=(self.question.id,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, "66.7%")
+
+
+class VoteCounterTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a logged in user and a question before test"""
+        cache.clear()
+        self.user = User.objects.create_user(username="mymelody")
+        self.user.set_password("hackme22")
+        self.user.save()
+        self.client.login(username="mymelody", password="hackme22")
+        self.question = create_question(question_text="Counter question.",
                                         days=-5)
-            choice1 = question1.choice_set.create(choice_text="A lot")
-            choice2 = question1.choice_set.create(choice_text="Not at all")
-            self.user = User.objects.create_user(username='mymelody')
-            self.client.post(reverse('polls:vote', args=(question1.id,)),
-                                {'choice': choice1.id})
-            self.assertEqual(question1.vote_set.get(user=self.user).choice,
-                                choice1)
-            self.assertEqual(Vote.objects.all().count(), 1)
-            self.client.post(reverse('polls:vote', args=(question1.id,)),
-                                {'choice': choice2.id})
-            self.assertEqual(question1.vote_set.get(user=self.user).choice,
-                                choice2)
-            self.assertEqual(Vote.objects.all().count(), 1)
-
-        def test_voter_is_authenticated(self):
-            """Test that only authenticated user can vote."""
-            question1 = create_question(question_text='Past Question.',
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def assertCounters(self, *expected):
+        """Check the counters of both choices."""
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.vote_count, self.choice2.vote_count),
+                         expected)
+
+    def test_new_vote_increments(self):
+        """A new vote adds one to the counter of its choice."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.assertCounters(1, 0)
+
+    def test_changed_vote_moves_counter(self):
+        """Changing a vote moves one from the old choice to the new choice."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice2.id})
+        self.assertCounters(0, 1)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_same_vote_keeps_counter(self):
+        """Voting the same choice again does not count twice."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.assertCounters(1, 0)
+
+    def test_deleted_vote_decrements(self):
+        """Deleting a vote takes it away from the counter."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        Vote.objects.all().delete()
+        self.assertCounters(0, 0)
+
+    def test_rebuild_command_repairs_drift(self):
+        """rebuild_vote_counts finds and repairs a drifted counter."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        Choice.objects.filter(pk=self.choice2.pk).update(vote_count=7)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_vote_counts', '--check', stdout=out)
+        self.assertCounters(1, 7)
+        call_command('rebuild_vote_counts', stdout=out)
+        self.assertCounters(1, 0)
+        call_command('rebuild_vote_counts', '--check', stdout=out)
+
+    def test_sharded_counters(self):
+        """
+        Votes on a sharded question are spread over shard rows and the
+        tally adds them back up.
+        """
+        Question.objects.filter(pk=self.question.pk).update(counter_shards=4)
+        for index in range(8):
+            user = User.objects.create_user(username=f"voter{index}")
+            self.client.force_login(user)
+            self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice2.id})
+        self.assertCounters(0, 0)
+        self.assertTrue(ChoiceCounterShard.objects.exists())
+        self.question.refresh_from_db()
+        self.assertEqual([c.num_votes for c in self.question.tally()], [7, 1])
+        self.assertEqual(self.choice1.votes, 7)
+
+    def test_rebuild_folds_shards(self):
+        """Repairing a sharded counter moves its whole amount to the choice."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        ChoiceCounterShard.objects.create(choice=self.choice1, shard=0,
+                                          count=3)
+        call_command('rebuild_vote_counts', stdout=StringIO())
+        self.assertCounters(1, 0)
+        self.assertFalse(ChoiceCounterShard.objects.exists())
+
+    def test_vote_query_count(self):
+        """
+        Casting and changing a vote each cost a fixed number of queries:
+        user, choice with its question, then the upsert with its counters,
+        cache bump and question touch. The session comes from the cache.
+        """
+        self.client.post(self.url, {'choice': self.choice1.id})
+        with self.assertNumQueries(9):
+            self.client.post(self.url, {'choice': self.choice2.id})
+        self.assertCounters(0, 1)
+
+    def test_unique_vote_per_question(self):
+        """The database refuses a second vote of a user on one question."""
+        Vote.objects.create(user=self.user, choice=self.choice1)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(user=self.user, choice=self.choice2)
+
+
+class ResultsCacheTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question with one vote before test"""
+        cache.clear()
+        self.user = User.objects.create_user(username="mymelody")
+        self.question = create_question(question_text="Cached question.",
                                         days=-5)
-            ans_a = self.client.post(reverse('polls:vote',
-                                                args=(question1.id,)))
-            self.assertEqual(ans_a.status_code, 200)
-            self.client.logout()
-            ans_b = self.client.post(reverse('polls:vote',
-                                                args=(question1.id,)))
-            self.assertEqual(ans_b.status_code, 302)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        self.vote = Vote.objects.create(user=self.user, choice=self.choice1)
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_second_view_is_cached(self):
+        """The second results view only loads the question."""
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, "100.0%")
+
+    def test_vote_invalidates(self):
+        """Changing a vote makes the next results view recompute."""
+        self.client.get(self.url)
+        self.vote.choice = self.choice2
+        self.vote.save()
+        tally = results_cache.get_tally(self.question)
+        self.assertEqual([c.num_votes for c in tally], [0, 1])
+
+    def test_choice_edit_invalidates(self):
+        """Editing a choice, as the admin does, makes the results stale."""
+        self.client.get(self.url)
+        self.choice2.choice_text = "Never"
+        self.choice2.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "Never")
+
+    def test_stale_tally_served_while_rebuilding(self):
+        """
+        While another request holds the rebuild lock, the stale tally is
+        served without any query.
+        """
+        results_cache.get_tally(self.question)
+        results_cache.invalidate(self.question.pk)
+        cache.add(results_cache.LOCK_KEY.format(self.question.pk), True)
+        with self.assertNumQueries(0):
+            tally = results_cache.get_tally(self.question)
+        self.assertEqual([c.num_votes for c in tally], [1, 0])
+
+    @override_settings(POLLS_RESULTS_MAX_STALENESS=0,
+                       POLLS_RESULTS_LOCK_TIMEOUT=0)
+    def test_too_stale_tally_is_recomputed(self):
+        """A tally older than the staleness bound is not served."""
+        results_cache.get_tally(self.question)
+        self.vote.delete()
+        cache.add(results_cache.LOCK_KEY.format(self.question.pk), True)
+        tally = results_cache.get_tally(self.question)
+        self.assertEqual([c.num_votes for c in tally], [0, 0])
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question with one vote before test"""
+        cache.clear()
+        self.user = User.objects.create_user(username="mymelody")
+        self.question = create_question(question_text="Conditional question.",
+                                        days=-5)
+        self.choice = self.question.choice_set.create(choice_text="A lot")
+        self.results_url = reverse('polls:results', args=(self.question.id,))
+        self.index_url = reverse('polls:index')
+
+    def test_results_not_modified(self):
+        """
+        The results page answers a matching If-None-Match with 304 after
+        loading only the question.
+        """
+        response = self.client.get(self.results_url)
+        etag = response.headers['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            response = self.client.get(self.results_url,
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_vary_on_cookie(self):
+        """Shared caches keep one copy of the pages per cookie."""
+        for url in (self.index_url, self.results_url):
+            response = self.client.get(url)
+            self.assertEqual(response.headers['Vary'], 'Cookie')
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['Vary'], 'Cookie')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.index_url).headers['Vary'],
+                         'Cookie')
+
+    def test_vote_changes_results_etag(self):
+        """A new vote gives the results page a new ETag."""
+        etag = self.client.get(self.results_url).headers['ETag']
+        Vote.objects.create(user=self.user, choice=self.choice)
+        response = self.client.get(self.results_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_index_not_modified(self):
+        """The index page answers a matching If-None-Match with 304."""
+        etag = self.client.get(self.index_url).headers['ETag']
+        # the validators come from the cache, not the questions table
+        with self.assertNumQueries(0):
+            response = self.client.get(self.index_url,
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_publication_changes_index_etag(self):
+        """A question reaching its publication date changes the ETag."""
+        create_question(question_text="Upcoming question.", days=1)
+        etag = self.client.get(self.index_url).headers['ETag']
+        later = timezone.now() + datetime.timedelta(days=2)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(self.index_url,
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Upcoming question.")
+
+    def test_new_question_changes_index_etag(self):
+        """Publishing a new question gives the index page a new ETag."""
+        etag = self.client.get(self.index_url).headers['ETag']
+        create_question(question_text="Another question.", days=-1)
+        response = self.client.get(self.index_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_changes_index_etag(self):
+        """The index page shows the login state, so its ETag depends on it."""
+        etag = self.client.get(self.index_url).headers['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(self.index_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', "query plans are SQLite specific")
+class QueryPlanTests(TestCase):
+    """
+    Capture the SQLite query plans of the hot lookups, so a lost index
+    shows up as a failing test.
+    """
+
+    def assertSearches(self, queryset, *fragments):
+        """Check that the query plan of queryset contains every fragment."""
+        plan = queryset.explain()
+        self.assertNotIn("SCAN", plan, msg=plan)
+        self.assertNotIn("TEMP B-TREE", plan, msg=plan)
+        for fragment in fragments:
+            self.assertIn(fragment, plan, msg=plan)
+
+    def test_index_page_plan(self):
+        """
+        A keyset page of the index is read in order from the
+        (pub_date, id) index, without sorting.
+        """
+        question = create_question(question_text="Question.", days=-1)
+        request = RequestFactory().get(reverse('polls:index'), {
+            'after': encode_cursor(question)})
+        view = IndexView()
+        view.setup(request)
+        self.assertSearches(view.get_page_queryset(),
+                            'INDEX question_pub_id_idx')
+
+    def test_open_polls_plan(self):
+        """
+        Polls open for voting are searched by a date range on one of the
+        question date indexes, SQLite picks any without statistics.
+        """
+        now = timezone.now()
+        queryset = Question.objects.filter(pub_date__lte=now,
+                                           end_date__gte=now)
+        self.assertSearches(queryset, 'USING INDEX question_')
+
+    def test_next_change_plan(self):
+        """The next publication and end dates are seeked in their index."""
+        now = timezone.now()
+        self.assertSearches(Question.objects.filter(
+            pub_date__gte=now).order_by('pub_date'), 'INDEX question_pub_')
+        self.assertSearches(Question.objects.filter(
+            end_date__gte=now).order_by('end_date'), 'INDEX question_end_idx')
+
+    def test_vote_of_user_on_question_plan(self):
+        """The vote of a user on a question is found by the unique index."""
+        queryset = Vote.objects.filter(user_id=1, question_id=1)
+        self.assertSearches(queryset, 'INDEX',
+                            '(user_id=? AND question_id=?)')
+
+    def test_vote_of_user_on_choice_plan(self):
+        """
+        The vote of a user on a choice is found by the (user, choice)
+        index.
+        """
+        queryset = Vote.objects.filter(user_id=1, choice_id=1)
+        self.assertSearches(queryset, 'INDEX vote_user_choice_idx')
+
+
+class QuestionStatusQuerySetTests(TestCase):
+    """
+    Property tests proving that the SQL filters of QuestionQuerySet agree
+    with is_published() and can_vote() for random questions.
+    """
+
+    def setUp(self) -> None:
+        """Create random questions around a fixed moment, with edge cases"""
+        self.now = timezone.now().replace(microsecond=0)
+        rng = random.Random(2022)
+        offsets = [-3, -1, 0, 1, 3]
+        for index in range(200):
+            pub_date = self.now + datetime.timedelta(
+                hours=rng.choice(offsets) * rng.randint(0, 48))
+            if rng.random() < 0.3:
+                end_date = None
+            else:
+                end_date = self.now + datetime.timedelta(
+                    hours=rng.choice(offsets) * rng.randint(0, 48))
+            Question.objects.create(question_text=f"Random {index}.",
+                                    pub_date=pub_date, end_date=end_date)
+
+    def assertAgrees(self, queryset, predicate):
+        """Check that queryset holds exactly the questions of predicate."""
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            expected = {q.pk for q in Question.objects.all() if predicate(q)}
+        self.assertEqual(set(queryset.values_list('pk', flat=True)),
+                         expected)
+
+    def test_published_agrees(self):
+        """published() holds the questions where is_published() is True."""
+        self.assertAgrees(Question.objects.published(self.now),
+                          lambda q: q.is_published())
+
+    def test_open_for_voting_agrees(self):
+        """open_for_voting() holds the questions where can_vote() is True."""
+        self.assertAgrees(Question.objects.open_for_voting(self.now),
+                          lambda q: q.can_vote())
+
+    def test_closed_agrees(self):
+        """closed() holds published questions where can_vote() is False."""
+        self.assertAgrees(Question.objects.closed(self.now),
+                          lambda q: q.is_published() and not q.can_vote())
+
+    def test_upcoming_agrees(self):
+        """upcoming() holds the questions where is_published() is False."""
+        self.assertAgrees(Question.objects.upcoming(self.now),
+                          lambda q: not q.is_published())
+
+    def test_admin_status_filter(self):
+        """The admin changelist filters questions by status in SQL."""
+        admin_user = User.objects.create_superuser(username="admin")
+        self.client.force_login(admin_user)
+        response = self.client.get(
+            reverse('admin:polls_question_changelist'), {'status': 'open'})
+        self.assertEqual(response.context['cl'].result_count,
+                         Question.objects.open_for_voting().count())
+
+
+class VoteIngestTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a queued ingestion mode on a temporary queue file"""
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            POLLS_VOTE_INGEST='queued',
+            POLLS_VOTE_QUEUE_PATH=os.path.join(directory.name, 'queue.db'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.queue = ingest.get_queue()
+        self.addCleanup(self.queue.close)
+        self.user = User.objects.create_user(username="mymelody")
+        self.client.force_login(self.user)
+        self.question = create_question(question_text="Queued question.",
+                                        days=-5)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_vote_is_queued(self):
+        """In queued mode the view only enqueues the vote."""
+        response = self.client.post(self.url, {'choice': self.choice1.id})
+        self.assertRedirects(response, reverse('polls:results',
+                                               args=(self.question.id,)),
+                             fetch_redirect_response=False)
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(self.queue.depth(), 1)
+        self.assertGreaterEqual(self.queue.lag(), 0)
+
+    def test_drain_last_write_wins(self):
+        """Draining keeps only the last vote of a user on a question."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.post(self.url, {'choice': self.choice2.id})
+        other = User.objects.create_user(username="other")
+        self.client.force_login(other)
+        self.client.post(self.url, {'choice': self.choice1.id})
+        out = StringIO()
+        with self.assertLogs('polls', 'INFO') as logs:
+            call_command('process_votes', '--once', stdout=out)
+        self.assertIn("applied 2 of 3 queued votes, depth=0", logs.output[0])
+        self.assertIn("applied 2 vote(s), depth=0", out.getvalue())
+        # the worker refreshes the statistics of every batch
+        self.assertEqual(self.question.stats.total_votes, 2)
+        self.assertEqual(Vote.objects.get(user=self.user).choice, self.choice2)
+        self.assertEqual([c.num_votes for c in self.question.tally()], [1, 1])
+
+    def test_drain_skips_deleted_choice(self):
+        """A queued vote for a choice deleted meanwhile is dropped."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.choice1.delete()
+        taken, applied, _ = ingest.drain(self.queue)
+        self.assertEqual((taken, applied), (1, 0))
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_drain_skips_deleted_user(self):
+        """A queued vote of a user deleted meanwhile does not block others."""
+        other = User.objects.create_user(username="leaving")
+        self.client.force_login(other)
+        self.client.post(self.url, {'choice': self.choice1.id})
+        self.client.force_login(self.user)
+        self.client.post(self.url, {'choice': self.choice2.id})
+        other.delete()
+        with transaction.atomic():
+            taken, applied, _ = ingest.drain(self.queue)
+            # the foreign keys of SQLite are only checked at commit
+            connection.check_constraints()
+        self.assertEqual((taken, applied), (2, 1))
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(Vote.objects.get().user, self.user)
+
+    def test_status_report(self):
+        """process_votes --status reports queue depth and lag."""
+        self.client.post(self.url, {'choice': self.choice1.id})
+        out = StringIO()
+        call_command('process_votes', '--status', stdout=out)
+        self.assertIn("depth=1", out.getvalue())
+
+
+# routes of the async views, used by AsyncViewTests as ROOT_URLCONF
+urlpatterns = [
+    path('polls/', include(([
+        path('', async_views.IndexView.as_view(), name='index'),
+        path('<int:pk>/', async_views.DetailView.as_view(), name='detail'),
+        path('<int:pk>/results/', async_views.ResultsView.as_view(),
+             name='results'),
+        path('<int:pk>/results/stream/', async_views.results_stream,
+             name='results_stream'),
+        path('<int:question_id>/vote/', async_views.vote, name='vote'),
+    ], 'polls'))),
+    path('accounts/', include('django.contrib.auth.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question and a user before test"""
+        cache.clear()
+        self.user = User.objects.create_user(username="mymelody")
+        self.question = create_question(question_text="Async question.",
+                                        days=-5)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+
+    async def test_index(self):
+        """The async index lists questions and answers 304 when unchanged."""
+        response = await self.async_client.get(reverse('polls:index'))
+        self.assertContains(response, "Async question.")
+        response = await self.async_client.get(
+            reverse('polls:index'),
+            headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_detail_requires_login(self):
+        """The async detail page redirects anonymous visitors to login."""
+        response = await self.async_client.get(
+            reverse('polls:detail', args=(self.question.id,)))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+
+    async def test_vote_and_results(self):
+        """An async vote is counted and shown by the async results page."""
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.post(
+            reverse('polls:vote', args=(self.question.id,)),
+            {'choice': self.choice2.id})
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(
+            reverse('polls:detail', args=(self.question.id,)))
+        self.assertEqual(response.context['selected_choice_id'],
+                         self.choice2.id)
+        response = await self.async_client.get(
+            reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(
+            [c.num_votes for c in response.context['choice_list']], [0, 1])
+
+    async def test_vote_without_choice(self):
+        """An async vote without a choice shows the voting form again."""
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.post(
+            reverse('polls:vote', args=(self.question.id,)))
+        self.assertContains(response, "You didn&#x27;t select a choice.")
+
+
+@override_settings(POLLS_STREAM_POLL_INTERVAL=0.01)
+class ResultsStreamTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question and a voter before test"""
+        cache.clear()
+        self.user = User.objects.create_user(username="mymelody")
+        self.question = create_question(question_text="Live question.",
+                                        days=-5)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+
+    async def test_snapshot_then_delta(self):
+        """A subscriber gets a snapshot, then a delta when a vote lands."""
+        hub = streams.TallyHub()
+        events = (await hub.subscribe(self.question)).events()
+        self.assertEqual(await anext(events), "retry: 3000\n\n")
+        snapshot = await anext(events)
+        self.assertTrue(snapshot.startswith("event: snapshot\n"))
+        self.assertIn(f'"{self.choice1.id}":0', snapshot)
+        await sync_to_async(Vote.objects.create)(user=self.user,
+                                                 choice=self.choice1)
+        delta = await asyncio.wait_for(anext(events), 5)
+        self.assertTrue(delta.startswith("event: delta\n"))
+        self.assertIn(f'"d":{{"{self.choice1.id}":1}}', delta)
+        await events.aclose()
+        self.assertEqual(hub.watchers, {})
+
+    async def test_viewers_share_one_watcher(self):
+        """All viewers of a question share one watcher and one tally load."""
+        hub = streams.TallyHub()
+        streams_ = [(await hub.subscribe(self.question)).events()
+                    for _ in range(5)]
+        for events in streams_:
+            await anext(events)
+            await anext(events)
+        self.assertEqual(len(hub.watchers), 1)
+        with mock.patch.object(results_cache, 'aget_tally',
+                               wraps=results_cache.aget_tally) as tally:
+            await sync_to_async(Vote.objects.create)(user=self.user,
+                                                     choice=self.choice2)
+            for events in streams_:
+                await asyncio.wait_for(anext(events), 5)
+        self.assertEqual(tally.call_count, 1)
+        for events in streams_:
+            await events.aclose()
+
+    async def test_slow_subscriber_gets_snapshot(self):
+        """A full queue is replaced by one snapshot of the latest counts."""
+        hub = streams.TallyHub(queue_size=2)
+        subscription = await hub.subscribe(self.question)
+        for index in range(3):
+            subscription.push(f"event: delta\ndata: {index}\n\n")
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertTrue(subscription.queue.get_nowait().startswith(
+            "event: snapshot\n"))
+        hub.unsubscribe(subscription)
+
+    @override_settings(POLLS_STREAM_HEARTBEAT=0.01)
+    async def test_heartbeat(self):
+        """A quiet stream sends heartbeat comments."""
+        hub = streams.TallyHub()
+        events = (await hub.subscribe(self.question)).events()
+        await anext(events)
+        await anext(events)
+        self.assertEqual(await anext(events), ": ping\n\n")
+        await events.aclose()
+
+    async def test_stream_view(self):
+        """The stream endpoint answers with an event stream."""
+        response = await self.async_client.get(
+            reverse('polls:results_stream', args=(self.question.id,)))
+        self.assertEqual(response.headers['Content-Type'],
+                         'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        events = response.streaming_content
+        await anext(events)
+        self.assertIn(b"event: snapshot", await anext(events))
+        await events.aclose()
+
+    @override_settings(POLLS_STREAM_MAX_AGE=0.05, POLLS_STREAM_HEARTBEAT=0.01)
+    async def test_stream_ends_after_max_age(self):
+        """A stream nobody closes still ends and forgets its subscription."""
+        hub = streams.TallyHub()
+        # a departed client: the server keeps sending into the void
+        sent = [event async for event in
+                (await hub.subscribe(self.question)).events()]
+        self.assertEqual(sent[0], "retry: 3000\n\n")
+        self.assertEqual(hub.subscribers, {})
+        self.assertEqual(hub.watchers, {})
+
+    def test_no_stream_under_wsgi(self):
+        """A WSGI server answers 204 and the page opens no stream."""
+        response = self.client.get(
+            reverse('polls:results_stream', args=(self.question.id,)))
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(
+            reverse('polls:results', args=(self.question.id,)))
+        self.assertNotContains(response, "EventSource(")
+        with override_settings(POLLS_ASYNC_VIEWS=True):
+            response = self.client.get(
+                reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, "EventSource(")
+
+
+class ResultsAPITests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize two questions with votes before test"""
+        cache.clear()
+        self.question = create_question(question_text="Results question.",
+                                        days=-5)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        self.other = create_question(question_text="Other question.", days=-3)
+        self.other.choice_set.create(choice_text="Yes")
+        for index in range(3):
+            user = User.objects.create_user(username=f"voter{index}")
+            choice = self.choice1 if index < 2 else self.choice2
+            Vote.objects.create(user=user, choice=choice)
+        self.url = reverse('polls:api_results', args=(self.question.id,))
+
+    def test_full_results(self):
+        """The full format carries texts, votes and percentages."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {
+            'id': self.question.id,
+            'question': "Results question.",
+            'total': 3,
+            'choices': [
+                {'id': self.choice1.id, 'text': "A lot", 'votes': 2,
+                 'percentage': 66.7},
+                {'id': self.choice2.id, 'text': "Not at all", 'votes': 1,
+                 'percentage': 33.3},
+            ],
+        })
+        self.assertNotIn(b'": ', response.content)
+
+    def test_compact_results(self):
+        """The compact format only carries the counts in choice order."""
+        response = self.client.get(self.url, {'format': 'compact'})
+        self.assertEqual(response.content,
+                         b'{"id":%d,"counts":[2,1]}' % self.question.id)
+
+    def test_unknown_format(self):
+        """An unknown format is not found."""
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_unpublished_question(self):
+        """A question that is not published has no results."""
+        future = create_question(question_text="Future question.", days=5)
+        response = self.client.get(reverse('polls:api_results',
+                                           args=(future.id,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified(self):
+        """The ETag answers 304 until a vote changes the results."""
+        etag = self.client.get(self.url).headers['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        compact = self.client.get(self.url, {'format': 'compact'},
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(compact.status_code, 200)
+        user = User.objects.create_user(username="latecomer")
+        Vote.objects.create(user=user, choice=self.choice2)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 4)
+
+    def test_gzip(self):
+        """A client accepting gzip gets a gzipped body."""
+        response = self.client.get(
+            reverse('polls:api_batch_results'),
+            {'ids': f"{self.question.id},{self.other.id}"},
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_batch_results(self):
+        """A batch keeps the asked order and leaves missing questions out."""
+        response = self.client.get(
+            reverse('polls:api_batch_results'),
+            {'ids': f"{self.other.id},999,{self.question.id}",
+             'format': 'compact'})
+        self.assertEqual(response.json(), {'results': [
+            {'id': self.other.id, 'counts': [0]},
+            {'id': self.question.id, 'counts': [2, 1]},
+        ]})
+
+    def test_batch_queries(self):
+        """
+        A batch loads the questions and all their counts in two queries,
+        and skips the counts query for tallies already cached.
+        """
+        ids = [self.question.id, self.other.id]
+        for index in range(5):
+            question = create_question(question_text=f"Batch {index}.",
+                                       days=-1)
+            question.choice_set.create(choice_text="Maybe")
+            ids.append(question.id)
+        params = {'ids': ','.join(str(pk) for pk in ids)}
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('polls:api_batch_results'),
+                                       params)
+        self.assertEqual(len(response.json()['results']), 7)
+        for pk in ids:
+            results_cache.get_tally(Question.objects.get(pk=pk))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('polls:api_batch_results'), params)
+
+    @override_settings(POLLS_API_MAX_BATCH=2)
+    def test_batch_limits(self):
+        """A batch needs valid ids, at most POLLS_API_MAX_BATCH of them."""
+        url = reverse('polls:api_batch_results')
+        for ids in ('', 'a,b', '1,2,3'):
+            response = self.client.get(url, {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'ids': '1,1,2'})
+        self.assertEqual(response.status_code, 200)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize an old and a recent question with votes before test"""
+        self.old = create_question(question_text="Old, question", days=-30)
+        self.recent = create_question(question_text="Recent question.",
+                                      days=-1)
+        self.choice = self.old.choice_set.create(choice_text="A lot")
+        self.recent.choice_set.create(choice_text="Not at all")
+        self.user = User.objects.create_user(username="mymelody",
+                                             password="hackme22")
+        Vote.objects.create(user=self.user, choice=self.choice)
+
+    def export(self, *args):
+        """Run export_polls and return its output."""
+        out = StringIO()
+        call_command('export_polls', *args, stdout=out)
+        return out.getvalue()
+
+    def test_questions_csv(self):
+        """The CSV has a header and quotes texts with commas."""
+        lines = self.export('questions').splitlines()
+        self.assertEqual(lines[0], 'id,question_text,pub_date,end_date')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith(f'{self.old.id},"Old, question",'
+                                            f'{self.old.pub_date.year}-'))
+
+    def test_votes_ndjson(self):
+        """NDJSON has one object per vote."""
+        lines = self.export('votes', '--format', 'ndjson').splitlines()
+        vote = Vote.objects.get()
+        row = json.loads(lines[0])
+        self.assertEqual(parse_datetime(row.pop('created_at')),
+                         vote.created_at.replace(
+                             microsecond=vote.created_at.microsecond // 1000
+                             * 1000))
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(row, {
+            'id': vote.id, 'user_id': self.user.id,
+            'question_id': self.old.id, 'choice_id': self.choice.id})
+
+    def test_choices_carry_counts(self):
+        """Choices are exported with their vote counts."""
+        lines = self.export('choices', '--question', str(self.old.id))
+        self.assertEqual(lines.splitlines(), [
+            'id,question_id,choice_text,votes',
+            f'{self.choice.id},{self.old.id},A lot,1'])
+
+    def test_date_range(self):
+        """--since and --before filter questions by publication date."""
+        since = (timezone.now() - datetime.timedelta(days=7)).date()
+        lines = self.export('questions', '--since', since.isoformat())
+        self.assertEqual(len(lines.splitlines()), 2)
+        self.assertIn("Recent question.", lines)
+        lines = self.export('votes', '--before', since.isoformat())
+        self.assertEqual(len(lines.splitlines()), 2)
+        with self.assertRaises(CommandError):
+            self.export('votes', '--since', 'yesterday')
+
+    def test_output_file(self):
+        """--output writes the file and reports the amount of rows."""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'votes.csv')
+            out = self.export('votes', '--output', path)
+            with open(path, encoding='utf-8') as exported:
+                self.assertEqual(len(exported.readlines()), 2)
+        self.assertIn("exported 1 votes", out)
+
+    def test_streams_in_one_query(self):
+        """Rows are fetched by one iterator query, in chunks."""
+        with self.assertNumQueries(1):
+            self.export('questions', '--chunk-size', '1')
+
+    def test_admin_action(self):
+        """The admin action streams the votes of the chosen questions."""
+        admin = User.objects.create_superuser(username="admin",
+                                              password="adminpass")
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:polls_question_changelist'),
+            {'action': 'export_votes_csv',
+             '_selected_action': [self.old.id, self.recent.id]})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.headers['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="votes-',
+                      response.headers['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), 2)
+
+
+class ImportTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a folder for the files to import before test"""
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def write(self, name, text):
+        """Write a file to import and return its path."""
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(text)
+        return path
+
+    def run_import(self, *args):
+        """Run import_polls and return its output."""
+        out = StringIO()
+        call_command('import_polls', *args, stdout=out)
+        return out.getvalue()
+
+    def fixture(self):
+        """Return a fixture of a question, two choices and two votes."""
+        return self.write('polls.json', json.dumps([
+            {"model": "polls.question", "pk": 7, "fields": {
+                "question_text": "Imported question?",
+                "pub_date": "2022-09-05T10:31:26.884Z", "end_date": None}},
+            {"model": "polls.choice", "pk": 70,
+             "fields": {"question": 7, "choice_text": "Yes"}},
+            {"model": "polls.choice", "pk": 71,
+             "fields": {"question": 7, "choice_text": "No"}},
+            {"model": "polls.vote", "pk": 1,
+             "fields": {"user": 2, "choice": 71}},
+            {"model": "polls.vote", "pk": 2,
+             "fields": {"user": 3, "choice": 71}},
+        ], indent=2))
+
+    def users(self):
+        """Return a CSV of two users, one with a hashed password."""
+        hashed = make_password("hackme22")
+        return self.write('users.csv', "id,username,password,is_staff\n"
+                                       f"2,mymelody,{hashed},False\n"
+                                       "3,kuromi,plaintext,True\n")
+
+    def test_import_resolves_ids(self):
+        """Foreign keys follow the input ids to the created rows."""
+        out = self.run_import(f"users={self.users()}", self.fixture(),
+                              '--batch-size', '2')
+        self.assertIn("imported 7 rows", out)
+        self.assertIn("rows/s", out)
+        question = Question.objects.get()
+        self.assertEqual(question.question_text, "Imported question?")
+        self.assertEqual(question.tally()[1].num_votes, 2)
+        vote = Vote.objects.get(user__username="kuromi")
+        self.assertEqual(vote.choice.choice_text, "No")
+        self.assertEqual(vote.question, question)
+
+    def test_passwords(self):
+        """Hashed passwords are kept, raw ones are hashed."""
+        self.run_import(f"users={self.users()}")
+        self.assertTrue(User.objects.get(username="mymelody")
+                        .check_password("hackme22"))
+        kuromi = User.objects.get(username="kuromi")
+        self.assertTrue(kuromi.check_password("plaintext"))
+        self.assertTrue(kuromi.is_staff)
+
+    def test_unknown_hasher(self):
+        """A hash of a hasher not installed fails, also on a dry run."""
+        users = self.write('users.csv', "id,username,password\n"
+                                        "2,mymelody,md5crypt$salt$"
+                                        "Ib7dfBm1Nd3JtL8PSTQUf0\n")
+        for args in ((), ('--dry-run',)):
+            with self.assertRaisesMessage(
+                    CommandError, "auth.user 2: password: unknown hasher "
+                                  "md5crypt"):
+                self.run_import(f"users={users}", *args)
+        self.assertFalse(User.objects.exists())
+
+    def test_existing_users_are_kept(self):
+        """A user with an existing username is not created again."""
+        user = User.objects.create_user(username="kuromi")
+        self.run_import(f"users={self.users()}", self.fixture())
+        self.assertEqual(User.objects.count(), 2)
+        self.assertTrue(Vote.objects.filter(user=user).exists())
+
+    def test_dry_run(self):
+        """--dry-run validates the files and writes nothing."""
+        out = self.run_import(f"users={self.users()}", self.fixture(),
+                              '--dry-run')
+        self.assertIn("validated 7 rows", out)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Question.objects.exists())
+
+    def test_unknown_reference(self):
+        """A vote of a user that was not imported fails the whole import."""
+        with self.assertRaisesMessage(CommandError, "unknown auth.user 2"):
+            self.run_import(self.fixture())
+        self.assertFalse(Question.objects.exists())
+
+    def test_flat_rows_need_kind(self):
+        """Rows without a model need the kind of the file."""
+        with self.assertRaises(CommandError):
+            self.run_import(self.users())
+
+    def test_export_round_trip(self):
+        """Files of export_polls can be imported again."""
+        user = User.objects.create_user(username="mymelody")
+        question = create_question(question_text="Exported.", days=-1)
+        choice = question.choice_set.create(choice_text="Yes")
+        Vote.objects.create(user=user, choice=choice)
+        paths = []
+        for kind, extension in (('questions', 'csv'), ('choices', 'ndjson'),
+                                ('votes', 'csv')):
+            path = os.path.join(self.folder, f'{kind}.{extension}')
+            call_command('export_polls', kind, '--format', extension,
+                         '--output', path, stdout=StringIO())
+            paths.append(f"{kind}={path}")
+        users = self.write('users.csv', f"id,username\n{user.id},mymelody\n")
+        self.run_import(f"users={users}", *paths)
+        copy = Question.objects.exclude(pk=question.pk).get()
+        self.assertEqual(copy.pub_date, question.pub_date)
+        self.assertEqual(Vote.objects.get(question=copy).created_at,
+                         Vote.objects.get(question=question).created_at)
+        self.assertEqual([c.num_votes for c in copy.tally()], [1])
+
+
+class QuestionStatsTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question with three votes out of four users"""
+        cache.clear()
+        self.question = create_question(question_text="Stats question.",
+                                        days=-5)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        self.users = [User.objects.create_user(username=f"voter{index}")
+                      for index in range(4)]
+        for index in range(3):
+            choice = self.choice1 if index < 2 else self.choice2
+            Vote.objects.create(user=self.users[index], choice=choice)
+
+    def test_refresh(self):
+        """refresh() computes turnout, leader, margin and votes per hour."""
+        stats.refresh([self.question])
+        figures = QuestionStats.objects.get(question=self.question)
+        self.assertEqual(figures.total_votes, 3)
+        self.assertEqual(figures.eligible_voters, 4)
+        self.assertEqual(figures.turnout, 75.0)
+        self.assertEqual(figures.leading_choice, self.choice1)
+        self.assertEqual(figures.margin, 1)
+        self.assertAlmostEqual(figures.votes_per_hour, 3 / 120, places=3)
+
+    def test_refresh_reads_counters(self):
+        """
+        refresh() reads the counters in a fixed amount of queries, the
+        full rebuild counts the Vote table.
+        """
+        Choice.objects.filter(pk=self.choice2.pk).update(vote_count=5)
+        with self.assertNumQueries(3):
+            stats.refresh([self.question])
+        self.assertEqual(self.question.stats.total_votes, 7)
+        self.assertEqual(stats.rebuild(), 1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.stats.total_votes, 3)
+
+    def test_refresh_stale(self):
+        """Only questions changed since their last refresh are refreshed."""
+        other = create_question(question_text="Quiet question.", days=-1)
+        self.assertEqual(stats.refresh_stale(), 2)
+        self.assertEqual(stats.refresh_stale(), 0)
+        Vote.objects.create(user=self.users[3], choice=self.choice2)
+        self.assertEqual(list(stats.stale_questions()), [self.question])
+        self.assertEqual(stats.refresh_stale(batch_size=1), 1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.stats.margin, 0)
+        self.assertIsNotNone(other.stats)
+
+    def test_command(self):
+        """refresh_question_stats refreshes stale or rebuilds everything."""
+        out = StringIO()
+        call_command('refresh_question_stats', stdout=out)
+        self.assertIn("refreshed the statistics of 1 question(s)",
+                      out.getvalue())
+        call_command('refresh_question_stats', '--full', stdout=out)
+        self.assertIn("rebuilt the statistics of 1 question(s)",
+                      out.getvalue())
+
+    @override_settings(POLLS_STATS_ON_VOTE=True)
+    def test_vote_refreshes(self):
+        """With POLLS_STATS_ON_VOTE the vote view refreshes the figures."""
+        self.client.force_login(self.users[3])
+        self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                         {'choice': self.choice2.id})
+        self.assertEqual(QuestionStats.objects.get().total_votes, 4)
+
+    def test_results_page(self):
+        """The results page shows the figures, its ETag follows them."""
+        url = reverse('polls:results', args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertNotContains(response, "Turnout")
+        stats.refresh([self.question])
+        refreshed = self.client.get(url,
+                                    HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(refreshed, "Turnout 75.0% of 4 voters")
+        self.assertContains(refreshed, "A lot leads by 1 vote(s)")
+
+    def test_admin_changelist(self):
+        """The changelist shows the figures without a query per question."""
+        for index in range(3):
+            create_question(question_text=f"More {index}.", days=-1)
+        stats.refresh(Question.objects.all())
+        admin = User.objects.create_superuser(username="admin",
+                                              password="adminpass")
+        self.client.force_login(admin)
+        url = reverse('admin:polls_question_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, "A lot (+1)")
+        self.assertContains(response, "75.0%")
+        create_question(question_text="One more.", days=-1)
+        stats.refresh(Question.objects.all())
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+
+class VoteTimelineTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a closed question with votes at known times"""
+        self.question = create_question(question_text="Timeline question.",
+                                        days=-5)
+        self.choice1 = self.question.choice_set.create(choice_text="A lot")
+        self.choice2 = self.question.choice_set.create(
+            choice_text="Not at all")
+        self.start = timezone.now().replace(minute=0, second=0,
+                                            microsecond=0) \
+            - datetime.timedelta(days=2)
+        offsets = [(self.choice1, 1), (self.choice1, 2), (self.choice2, 2),
+                   (self.choice1, 61)]
+        for index, (choice, minutes) in enumerate(offsets):
+            user = User.objects.create_user(username=f"voter{index}")
+            vote = Vote.objects.create(user=user, choice=choice)
+            Vote.objects.filter(pk=vote.pk).update(
+                created_at=self.start + datetime.timedelta(minutes=minutes))
+        self.url = reverse('polls:api_timeline', args=(self.question.id,))
+
+    def close(self):
+        """Close the poll of the question."""
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=timezone.now() - datetime.timedelta(days=1))
+        self.question.refresh_from_db()
+
+    def test_vote_times(self):
+        """A vote records when it was cast and when it last changed."""
+        user = User.objects.create_user(username="latecomer")
+        vote = Vote.objects.create(user=user, choice=self.choice1)
+        self.assertIsNotNone(vote.created_at)
+        cast = vote.created_at
+        vote.choice = self.choice2
+        vote.save()
+        vote.refresh_from_db()
+        self.assertEqual(vote.created_at, cast)
+        self.assertGreater(vote.updated_at, cast)
+
+    def test_hour_buckets(self):
+        """Votes are counted per hour and per choice."""
+        response = self.client.get(self.url, {'bucket': 'hour'})
+        payload = response.json()
+        self.assertEqual(payload['choices'], [self.choice1.id,
+                                              self.choice2.id])
+        self.assertEqual([counts for _, counts in payload['buckets']],
+                         [[2, 1], [1, 0]])
+        self.assertEqual(parse_datetime(payload['buckets'][0][0]),
+                         self.start)
+        self.assertEqual(payload['untimed'], 0)
+
+    def test_minute_buckets_and_range(self):
+        """Minute buckets can be limited to a range of time."""
+        since = self.start + datetime.timedelta(minutes=2)
+        response = self.client.get(self.url, {
+            'bucket': 'minute', 'since': since.isoformat(),
+            'until': (since + datetime.timedelta(minutes=30)).isoformat()})
+        self.assertEqual(response.json()['buckets'],
+                         [[since.isoformat().replace('+00:00', 'Z'),
+                           [1, 1]]])
+        for params in ({'bucket': 'day'}, {'since': 'yesterday'}):
+            self.assertEqual(self.client.get(self.url, params).status_code,
+                             404)
+
+    def test_untimed_votes(self):
+        """Votes cast before times were recorded are only counted."""
+        Vote.objects.filter(choice=self.choice2).update(created_at=None)
+        payload = self.client.get(self.url).json()
+        self.assertEqual(payload['untimed'], 1)
+        self.assertEqual([counts for _, counts in payload['buckets']],
+                         [[2, 0], [1, 0]])
+
+    def test_rollup(self):
+        """A closed poll is read from its buckets once rolled up."""
+        self.close()
+        self.assertEqual(list(timeline.pending_rollups()), [self.question])
+        out = StringIO()
+        call_command('rollup_vote_timelines', stdout=out)
+        self.assertIn("question %d: 7 bucket(s)" % self.question.id,
+                      out.getvalue())
+        self.assertFalse(timeline.pending_rollups().exists())
+        # moving a vote without touching the question keeps the buckets
+        Vote.objects.filter(choice=self.choice2).update(
+            created_at=self.start + datetime.timedelta(hours=5))
+        self.question.refresh_from_db()
+        buckets = timeline.get_buckets(self.question, 'hour')
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual([start for start, _, _ in buckets],
+                         [self.start, self.start, self.start + hour])
+
+    def test_rollup_goes_stale(self):
+        """A change of the closed poll makes the buckets stale."""
+        self.close()
+        timeline.rollup(self.question)
+        Vote.objects.filter(choice=self.choice2).delete()
+        self.question.refresh_from_db()
+        self.assertFalse(timeline.is_rolled_up(self.question))
+        self.assertEqual([count for _, _, count in timeline.get_buckets(
+            self.question, 'hour')], [2, 1])
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a poll closed long ago with three votes"""
+        self.question = create_question(question_text="Old question.",
+                                        days=-100)
+        self.choice1 = self.question.choice_set.create(choice_text="Yes")
+        self.choice2 = self.question.choice_set.create(choice_text="No")
+        for index, choice in enumerate([self.choice1, self.choice1,
+                                        self.choice2]):
+            user = User.objects.create_user(username=f"voter{index}")
+            Vote.objects.create(user=user, choice=choice)
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=timezone.now() - datetime.timedelta(days=60))
+        self.question.refresh_from_db()
+
+    def test_results_after_archive(self):
+        """The results page shows the final tally once the votes are gone."""
+        call_command('archive_polls', stdout=StringIO())
+        self.assertFalse(Vote.objects.exists())
+        self.question.refresh_from_db()
+        self.assertIsNotNone(self.question.archived_at)
+        response = self.client.get(reverse('polls:results',
+                                           args=(self.question.id,)))
+        self.assertEqual([(c.choice_text, c.num_votes)
+                          for c in response.context['choice_list']],
+                         [("Yes", 2), ("No", 1)])
+        self.assertEqual(response.context['stats'].total_votes, 3)
+        self.assertEqual(sum(count for _, _, count in timeline.get_buckets(
+            self.question, 'hour')), 3)
+
+    def assertTally(self, counts):
+        """Check the vote counts of the two choices."""
+        self.assertEqual([c.num_votes for c in self.question.tally()], counts)
+
+    def test_purge_keeps_frozen_tally(self):
+        """Purged votes stay counted, other deleted votes do not."""
+        archive.freeze(self.question)
+        modified = Question.objects.get(pk=self.question.pk).last_modified
+        self.assertEqual(archive.purge_votes(self.question, batch_size=2), 3)
+        self.assertTally([2, 1])
+        self.assertEqual(Question.objects.get(
+            pk=self.question.pk).last_modified, modified)
+        other = create_question(question_text="Open.", days=-1)
+        choice = other.choice_set.create(choice_text="Yes")
+        Vote.objects.create(user=User.objects.get(username="voter0"),
+                            choice=choice).delete()
+        choice.refresh_from_db()
+        self.assertEqual(choice.vote_count, 0)
+
+    def test_vote_rejected(self):
+        """A vote on an archived poll leaves the frozen tally alone."""
+        call_command('archive_polls', stdout=StringIO())
+        # even when reopened by the admin
+        Question.objects.filter(pk=self.question.pk).update(end_date=None)
+        self.client.force_login(User.objects.get(username="voter2"))
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = self.client.post(url, {'choice': self.choice1.id})
+        self.assertRedirects(response, reverse('polls:results',
+                                               args=(self.question.id,)))
+        self.assertTally([2, 1])
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(ingest.apply_batch(
+            [(1, 1, self.question.id, self.choice1.id, 0.0)]), 0)
+        self.assertTally([2, 1])
+        self.assertIn(self.question, Question.objects.closed())
+        self.assertNotIn(self.question, Question.objects.open_for_voting())
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_async_vote_rejected(self):
+        """The async vote view rejects archived polls too."""
+        await sync_to_async(call_command)('archive_polls', stdout=StringIO())
+        user = await User.objects.aget(username="voter2")
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.post(
+            reverse('polls:vote', args=(self.question.id,)),
+            {'choice': self.choice1.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await Vote.objects.aexists())
+        await sync_to_async(self.assertTally)([2, 1])
+
+    def test_move_or_delete(self):
+        """Votes are moved to the archive table or deleted."""
+        call_command('archive_polls', stdout=StringIO())
+        self.assertEqual(ArchivedVote.objects.filter(
+            question=self.question, choice_id=self.choice1.id).count(), 2)
+        # the admin estimates follow the moved votes
+        self.assertEqual(paginators.estimate_count(ArchivedVote.objects.all()),
+                         3)
+        self.assertIn(paginators.estimate_count(Vote.objects.all()),
+                      (0, None))
+        other = create_question(question_text="Deleted.", days=-100)
+        choice = other.choice_set.create(choice_text="Maybe")
+        Vote.objects.create(user=User.objects.get(username="voter0"),
+                            choice=choice)
+        Question.objects.filter(pk=other.pk).update(
+            vote_retention='delete',
+            end_date=timezone.now() - datetime.timedelta(days=60))
+        call_command('archive_polls', stdout=StringIO())
+        self.assertFalse(Vote.objects.exists())
+        self.assertFalse(ArchivedVote.objects.filter(question=other).exists())
+        choice.refresh_from_db()
+        self.assertEqual(choice.vote_count, 1)
+
+    def test_retention_respected(self):
+        """Kept polls and polls not past their retention are left alone."""
+        Question.objects.filter(pk=self.question.pk).update(
+            vote_retention='keep')
+        self.assertEqual(archive.due_questions(), [])
+        Question.objects.filter(pk=self.question.pk).update(
+            vote_retention='', retention_days=90)
+        self.assertEqual(archive.due_questions(), [])
+        with override_settings(POLLS_ARCHIVE_AFTER_DAYS=90):
+            Question.objects.filter(pk=self.question.pk).update(
+                retention_days=None)
+            self.assertEqual(archive.due_questions(), [])
+        self.assertEqual(archive.due_questions(), [self.question])
+
+    def test_counters_not_rebuilt(self):
+        """Rebuilding counters and statistics keeps the frozen tally."""
+        call_command('archive_polls', stdout=StringIO())
+        call_command('rebuild_vote_counts', stdout=StringIO())
+        call_command('refresh_question_stats', '--full', stdout=StringIO())
+        call_command('rollup_vote_timelines', self.question.id,
+                     stdout=StringIO())
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 2)
+        self.assertEqual(QuestionStats.objects.get(
+            question=self.question).total_votes, 3)
+        self.question.refresh_from_db()
+        self.assertEqual(sum(count for _, _, count in timeline.get_buckets(
+            self.question, 'hour')), 3)
+
+    def test_resume(self):
+        """An interrupted archive finishes on the next run."""
+        with mock.patch('polls.archive.time.sleep',
+                        side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                archive.archive(self.question, batch_size=1, pause=1)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(archive.due_questions(), [self.question])
+        out = StringIO()
+        call_command('archive_polls', '--batch-size', '1', stdout=out)
+        self.assertIn("question %d: 2 vote(s) moved" % self.question.id,
+                      out.getvalue())
+        self.assertEqual(archive.due_questions(), [])
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 2)
+
+
+class AdminChangelistTests(TestCase):
+    """Changelists of questions, choices and votes stay within a budget."""
+
+    # queries of each changelist page, whatever the size of the tables
+    budgets = {'question': 5, 'choice': 5, 'vote': 5}
+
+    def setUp(self) -> None:
+        """Initialize an admin and some votes before test"""
+        self.admin = User.objects.create_superuser(username="admin",
+                                                   password="adminpass")
+        self.client.force_login(self.admin)
+        self.generate(3)
+
+    def generate(self, amount):
+        """Create questions with two choices, voted on by new users."""
+        users = User.objects.bulk_create(
+            User(username=f"voter{User.objects.count()}-{index}")
+            for index in range(amount))
+        for index in range(amount):
+            question = create_question(question_text=f"Question {index}.",
+                                       days=-1)
+            choice = question.choice_set.create(choice_text="Yes")
+            question.choice_set.create(choice_text="No")
+            for user in users:
+                Vote.objects.create(user=user, choice=choice)
+
+    def changelist_queries(self, model, params=None):
+        """Return the queries of one changelist page."""
+        url = reverse(f'admin:polls_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_budgets(self):
+        """The queries of a page do not grow with the tables."""
+        small = {model: len(self.changelist_queries(model))
+                 for model in self.budgets}
+        self.generate(12)
+        for model, budget in self.budgets.items():
+            queries = self.changelist_queries(model)
+            self.assertEqual(len(queries), small[model], model)
+            self.assertLessEqual(len(queries), budget, model)
+
+    @override_settings(POLLS_ADMIN_COUNT_LIMIT=5)
+    def test_large_tables_are_not_counted(self):
+        """
+        Over the count limit, an unfiltered list is estimated and a
+        filtered list is counted up to the limit only.
+        """
+        paginators.refresh_estimates(Vote)
+        queries = self.changelist_queries('vote')
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+        self.assertTrue([sql for sql in queries if 'sqlite_stat1' in sql])
+        queries = self.changelist_queries('vote', {'q': 'voter0-0'})
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT 5', counts[0])
+
+    def test_counts_shown(self):
+        """Choices show their vote counters."""
+        response = self.client.get(
+            reverse('admin:polls_choice_changelist'), {'o': '-3'})
+        self.assertContains(response, '<td class="field-votes">3</td>',
+                            html=True)
+
+    def test_no_select_of_every_row(self):
+        """Change forms pick related rows by id or autocomplete."""
+        vote = Vote.objects.first()
+        response = self.client.get(reverse('admin:polls_vote_change',
+                                           args=(vote.id,)))
+        self.assertContains(response, 'vForeignKeyRawIdAdminField', count=3)
+        choice = Choice.objects.first()
+        response = self.client.get(reverse('admin:polls_choice_change',
+                                           args=(choice.id,)))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, "Question 2.")
+
+
+@override_settings(POLLS_ADMIN_COUNT_LIMIT=5)
+class EstimatedCountPaginatorTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize twenty questions and their analyzed statistics"""
+        for index in range(20):
+            create_question(question_text=f"Question {index}.", days=-1)
+        paginators.refresh_estimates(Question)
+
+    def paginator(self):
+        """Return a paginator of all questions, five per page."""
+        return paginators.EstimatedCountPaginator(
+            Question.objects.order_by('-pk'), 5)
+
+    def test_estimate(self):
+        """An unfiltered list over the limit is estimated, not counted."""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.paginator().count, 20)
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+        self.assertEqual(paginators.EstimatedCountPaginator(
+            Question.objects.filter(pk__gt=0), 5).count, 5)
+
+    def test_deleted_rows(self):
+        """Deleted rows leave the estimate once analyzed, never a bad page."""
+        Question.objects.filter(pk__in=Question.objects.order_by(
+            'pk').values('pk')[:10]).delete()
+        paginator = self.paginator()
+        self.assertEqual(paginator.page(2).number, 2)
+        # the statistics still count the deleted rows
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+        self.assertEqual(paginator.count, 5)
+        paginators.refresh_estimates(Question)
+        paginator = self.paginator()
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(len(paginator.page(2).object_list), 5)
+
+
+@skipUnless(os.environ.get('POLLS_SCALE_TESTS'),
+            "set POLLS_SCALE_TESTS=1 to generate a million votes")
+class AdminScaleTests(TestCase):
+    """Changelist budgets with a million votes, slow to set up."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Generate 1000 questions, 1000 users and 1,000,000 votes"""
+        cls.admin = User.objects.create_superuser(username="admin",
+                                                  password="adminpass")
+        User.objects.bulk_create(User(username=f"voter{index}")
+                                 for index in range(1000))
+        pub_date = timezone.now() - datetime.timedelta(days=1)
+        Question.objects.bulk_create(
+            Question(question_text=f"Question {index}.", pub_date=pub_date)
+            for index in range(1000))
+        Choice.objects.bulk_create(
+            Choice(question=question, choice_text="Yes", vote_count=1000)
+            for question in Question.objects.all())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO polls_vote (user_id, question_id, choice_id, "
+                "created_at) SELECT u.id, c.question_id, c.id, %s "
+                "FROM auth_user u, polls_choice c WHERE u.id <> %s",
+                [timezone.now(), cls.admin.id])
+        paginators.refresh_estimates(Vote)
+
+    def test_budgets(self):
+        """Every changelist page stays within its budget and uncounted."""
+        self.client.force_login(self.admin)
+        for model, budget in AdminChangelistTests.budgets.items():
+            url = reverse(f'admin:polls_{model}_changelist')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(queries), budget, model)
+        # the million votes are estimated, never counted
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+        self.assertContains(response, "1000000 votes")
+
+
+class DatabaseProfileTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a connection to a SQLite file with the site profile"""
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        profile = db_profiles.sqlite(settings.BASE_DIR)
+        self.db = sqlite_backend.DatabaseWrapper(
+            {**connection.settings_dict, **profile, 'NAME': self.path},
+            alias='profile')
+
+    def tearDown(self) -> None:
+        """Close the connection and remove its files"""
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_pragmas(self):
+        """A new connection runs the PRAGMAs of the profile."""
+        with self.db.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_write_lock_taken_at_begin(self):
+        """A transaction holds the write lock before its first write."""
+        connections['profile'] = self.db
+        self.addCleanup(delattr, connections._connections, 'profile')
+        with transaction.atomic(using='profile'):
+            other = sqlite3.connect(self.path, timeout=0)
+            with self.assertRaises(sqlite3.OperationalError):
+                other.execute("BEGIN IMMEDIATE")
+            other.close()
+
+    def test_profile_from_config(self):
+        """DB_PROFILE chooses the profile, an unknown one is refused."""
+        environ = {'DB_PROFILE': 'postgresql', 'DB_NAME': 'polls',
+                   'DB_POOLER': 'True'}
+        with mock.patch.dict(os.environ, environ):
+            database = db_profiles.database(settings.BASE_DIR)
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['NAME'], 'polls')
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+        with mock.patch.dict(os.environ, {'DB_PROFILE': 'oracle'}):
+            with self.assertRaises(ImproperlyConfigured):
+                db_profiles.database(settings.BASE_DIR)
+
+
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a published question and a logged in voter"""
+        cache.clear()
+        self.question = create_question(question_text="Replica question.",
+                                        days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.user = User.objects.create_user(username="voter")
+        self.client.force_login(self.user)
+        self.router = routers.PrimaryReplicaRouter()
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def record_routes(self, url):
+        """Return the (read alias, SQL) of every query of a GET."""
+        routes = []
+
+        def record(execute, sql, params, many, context):
+            routes.append((routers.read_alias(), sql))
+            return execute(sql, params, many, context)
+
+        cache.clear()
+        with connection.execute_wrapper(record):
+            self.client.get(url)
+        return routes
+
+    @override_settings(POLLS_REPLICA_DATABASE='replica')
+    def test_router(self):
+        """Only polls reads of a read-only view go to the replica."""
+        self.assertIsNone(self.router.db_for_read(Question))
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Question), 'replica')
+            self.assertIsNone(self.router.db_for_read(User))
+            with routers.primary():
+                self.assertIsNone(self.router.db_for_read(Vote))
+            self.assertEqual(self.router.db_for_write(Vote), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'polls'))
+        self.assertIsNone(self.router.allow_migrate('default', 'polls'))
+
+    @override_settings(POLLS_REPLICA_DATABASE='default')
+    def test_index_not_cached_while_replica_lags(self):
+        """A freshly changed index is not revalidated from the replica."""
+        self.client.logout()
+        index = reverse('polls:index')
+        self.assertFalse(self.client.get(index).has_header('ETag'))
+        with override_settings(POLLS_REPLICA_STICKY_SECONDS=0):
+            self.assertTrue(self.client.get(index).has_header('ETag'))
+
+    @override_settings(POLLS_REPLICA_DATABASE='default')
+    def test_read_views_use_replica(self):
+        """The results page reads the replica, the cached tally the primary."""
+        routes = self.record_routes(self.url)
+        polls_reads = [alias for alias, sql in routes if 'polls_' in sql]
+        self.assertIn('default', polls_reads)
+        tally = [alias for alias, sql in routes
+                 if 'polls_choicecountershard' in sql]
+        self.assertEqual(tally, [None])
+        detail = self.record_routes(reverse('polls:detail',
+                                            args=(self.question.id,)))
+        self.assertEqual({alias for alias, _ in detail}, {None})
+
+    @override_settings(POLLS_REPLICA_DATABASE='default')
+    def test_voter_sticks_to_primary(self):
+        """After voting, the voter reads the primary for a while."""
+        response = self.client.post(reverse('polls:vote',
+                                            args=(self.question.id,)),
+                                    {'choice': self.choice.id})
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        routes = self.record_routes(self.url)
+        self.assertEqual({alias for alias, _ in routes}, {None})
+
+    def test_no_sticky_cookie_without_replica(self):
+        """Without a replica, voting sets no cookie."""
+        response = self.client.post(reverse('polls:vote',
+                                            args=(self.question.id,)),
+                                    {'choice': self.choice.id})
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_copy_database(self):
+        """The replication stand-in copies the primary file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source = os.path.join(directory.name, 'primary.sqlite3')
+        target = os.path.join(directory.name, 'replica.sqlite3')
+        primary = sqlite3.connect(source)
+        primary.execute("CREATE TABLE vote (id INTEGER PRIMARY KEY)")
+        primary.execute("INSERT INTO vote VALUES (1)")
+        primary.commit()
+        replication.copy_database(source, target)
+        primary.execute("INSERT INTO vote VALUES (2)")
+        primary.commit()
+        primary.close()
+        replica = sqlite3.connect(target)
+        self.assertEqual(replica.execute("SELECT id FROM vote").fetchall(),
+                         [(1,)])
+        replica.close()
+        with self.assertRaises(CommandError):
+            call_command('sync_replica', stdout=StringIO())
+
+
+class SessionQueryTests(TestCase):
+
+    # queries of each view once the caches are warm, for a logged in user
+    budgets = {'index': 1, 'results': 1, 'api': 1, 'detail': 4, 'vote': 7}
+
+    def setUp(self) -> None:
+        """Initialize a question and a logged in voter"""
+        cache.clear()
+        self.question = create_question(question_text="Session question.",
+                                        days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.user = User.objects.create_user(username="voter",
+                                             password="password")
+        self.client.login(username="voter", password="password")
+        pk = self.question.id
+        self.requests = {
+            'index': ('get', reverse('polls:index'), {}),
+            'results': ('get', reverse('polls:results', args=(pk,)), {}),
+            'api': ('get', reverse('polls:api_results', args=(pk,)), {}),
+            'detail': ('get', reverse('polls:detail', args=(pk,)), {}),
+            'vote': ('post', reverse('polls:vote', args=(pk,)),
+                     {'choice': self.choice.id}),
+        }
+
+    def request(self, name):
+        """Send one of the requests and return the response."""
+        method, url, data = self.requests[name]
+        return getattr(self.client, method)(url, data)
+
+    def test_queries_per_view(self):
+        """Every view stays within its query budget."""
+        for name, budget in self.budgets.items():
+            self.request(name)
+            with self.assertNumQueries(budget):
+                self.request(name)
+
+    def test_public_pages_skip_session(self):
+        """Index, results and API pages never load the session."""
+        for name in ('index', 'results', 'api'):
+            response = self.request(name)
+            self.assertFalse(response.wsgi_request.session.accessed, name)
+        self.assertContains(self.request('index'), "Log Out")
+        self.client.logout()
+        self.assertContains(self.request('index'), "Log in")
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        """With signed cookies a vote never queries the session table."""
+        self.client.login(username="voter", password="password")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('vote')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([query for query in queries
+                          if 'django_session' in query['sql']])
+
+    def test_messages_in_cookie(self):
+        """Messages are kept in a cookie, the session is not written."""
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=timezone.now() - datetime.timedelta(hours=1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('detail')
+        self.assertIn('messages', response.cookies)
+        self.assertFalse([query for query in queries
+                          if 'django_session' in query['sql']])
+
+
+class PasswordHashingTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a user whose password was hashed by Django 4.1"""
+        self.user = User.objects.create_user(username="legacy")
+        self.user.password = PBKDF2PasswordHasher().encode(
+            "hackme22", "legacysalt", 390000)
+        self.user.save()
+
+    def test_profiles(self):
+        """The chosen hasher hashes new passwords, the others still check."""
+        self.assertTrue(make_password("secret").startswith("scrypt$"))
+        hashers = password_hashers('pbkdf2')
+        self.assertEqual(hashers[0], 'mysite.hashers.PBKDF2PasswordHasher')
+        self.assertIn('mysite.hashers.ScryptPasswordHasher', hashers)
+
+    def test_rehash_on_login(self):
+        """A login rehashes an older password with the chosen hasher."""
+        self.assertTrue(self.client.login(username="legacy",
+                                          password="hackme22"))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("scrypt$16384$"))
+        with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 13):
+            self.assertTrue(self.client.login(username="legacy",
+                                              password="hackme22"))
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith("scrypt$8192$"))
+
+    def test_scrypt_memory_limit(self):
+        """A hash costing more than twice the setting is not checked."""
+        hasher = ScryptPasswordHasher()
+        encoded = hasher.encode("hackme22", "salt", n=2 ** 15)
+        self.assertTrue(hasher.verify("hackme22", encoded))
+        self.user.password = "scrypt$1048576$salt$8$1$" + "A" * 44
+        self.user.save()
+        self.assertFalse(self.client.login(username="legacy",
+                                           password="hackme22"))
+        self.assertFalse(hasher.verify(
+            "hackme22", hasher.encode("hackme22", "salt", p=2)))
+
+    def test_provision_users(self):
+        """A roster creates new accounts and skips existing ones."""
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', newline='') as roster:
+            roster.write("username,password,email\n"
+                         "legacy,other-pass,\n"
+                         "6510545000,first-pass,a@ku.th\n"
+                         "6510545001,,\n")
+        out = StringIO()
+        call_command('provision_users', path, '--workers', '2',
+                     '--chunk-size', '1', stdout=out)
+        self.assertIn("provisioned 2 user(s), skipped 1 existing",
+                      out.getvalue())
+        student = User.objects.get(username="6510545000")
+        self.assertEqual(student.email, "a@ku.th")
+        self.assertTrue(student.check_password("first-pass"))
+        self.assertFalse(User.objects.get(
+            username="6510545001").has_usable_password())
+        self.assertFalse(User.objects.get(
+            username="legacy").check_password("other-pass"))
+        with self.assertRaises(CommandError):
+            call_command('provision_users', path + '.missing',
+                         stdout=StringIO())
+
+    def test_provision_race(self):
+        """An account created while hashing counts as skipped."""
+        def hash_all(passwords):
+            User.objects.create_user(username="6510545000")
+            return accounts.hash_passwords(passwords)
+
+        with accounts.Provisioner() as provisioner, mock.patch.object(
+                provisioner, 'hash_all', side_effect=hash_all):
+            provisioner.add([
+                {**dict.fromkeys(accounts.FIELDS, ''), 'username': username}
+                for username in ("6510545000", "6510545001")])
+        self.assertEqual((provisioner.created, provisioner.skipped), (1, 1))
+
+
+@override_settings(POLLS_RATE_LIMITS={'vote': {'user': '2/60', 'ip': '3/60'},
+                                      'signup': {'ip': '1/600'}})
+class RateLimitTests(TestCase):
+
+    def setUp(self) -> None:
+        """Initialize a question and a logged in voter with empty buckets"""
+        cache.clear()
+        self.question = create_question(question_text="Limited question.",
+                                        days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.user = User.objects.create_user(username="voter")
+        self.client.force_login(self.user)
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def test_user_limit(self):
+        """A voter over the limit gets 429 without a database query."""
+        for _ in range(2):
+            response = self.client.post(self.url, {'choice': self.choice.id})
+            self.assertEqual(response.status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '30')
+
+    def test_ip_limit(self):
+        """Voters behind one address share its bucket."""
+        for index in range(3):
+            self.client.force_login(
+                User.objects.create_user(username=f"student{index}"))
+            response = self.client.post(self.url, {'choice': self.choice.id},
+                                        REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(self.url, {'choice': self.choice.id},
+                                    REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(self.url, {'choice': self.choice.id},
+                                    REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
+    def test_forwarded_for_ignored(self):
+        """A client cannot pick its bucket by writing X-Forwarded-For."""
+        for index in range(4):
+            self.client.force_login(
+                User.objects.create_user(username=f"student{index}"))
+            response = self.client.post(self.url, {'choice': self.choice.id},
+                                        HTTP_X_FORWARDED_FOR=f'10.0.1.{index}')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(POLLS_TRUSTED_PROXIES=1)
+    def test_trusted_proxy(self):
+        """Behind one proxy the address it appended is used."""
+        request = RequestFactory().get(
+            '/', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.1',
+            REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(ratelimit.get_client_ip(request), '10.0.0.1')
+        request = RequestFactory().get('/', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(ratelimit.get_client_ip(request), '127.0.0.1')
+
+    def test_refill(self):
+        """An empty bucket has a token again once its period has passed."""
+        limits = ratelimit.get_limits('vote')
+        keys = {'user': 1}
+        self.assertEqual(ratelimit.take('vote', keys, limits, now=100), 0)
+        self.assertEqual(ratelimit.take('vote', keys, limits, now=100), 0)
+        self.assertEqual(ratelimit.take('vote', keys, limits, now=100), 30)
+        self.assertEqual(ratelimit.take('vote', keys, limits, now=115), 15)
+        self.assertEqual(ratelimit.take('vote', keys, limits, now=130), 0)
+
+    def test_signup_posts(self):
+        """Only the signup form posts are limited."""
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('signup')).status_code,
+                             200)
+        self.client.post(reverse('signup'), {'username': "new"})
+        response = self.client.post(reverse('signup'), {'username': "new"})
+        self.assertEqual(response.status_code, 429)
+
+    def test_check_in_fresh_process(self):
+        """The URLconf imports on its own, whatever module is loaded first."""
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'check'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_async_vote(self):
+        """The async vote view is limited like the sync one."""
+        await sync_to_async(self.async_client.force_login)(self.user)
+        statuses = [(await self.async_client.post(
+            self.url, {'choice': self.choice.id})).status_code
+            for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
@@ -0,0 +1,96 @@
+"""Votes of a question counted per minute or per hour.
+
+Buckets are counted by the database with ``TruncMinute``/``TruncHour`` of
+``Vote.created_at``; a vote is counted at the time it was first cast, for
+the choice it has now. Once a poll is closed its buckets can be stored in
+``VoteBucket`` by ``rollup()``, then its timeline is read from them at a
+cost that follows the amount of buckets instead of the amount of votes.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncHour, TruncMinute
+from django.utils import timezone
+from .models import Question, Vote, VoteBucket
+
+TRUNCATE = {'minute': TruncMinute, 'hour': TruncHour}
+
+
+def count_votes(question, resolution):
+    """Return the buckets counted from the votes of a question.
+
+    Returns:
+        QuerySet: dicts with ``start``, ``choice_id`` and ``count``,
+        ordered by start.
+    """
+    return Vote.objects.filter(
+        question=question, created_at__isnull=False
+    ).annotate(start=TRUNCATE[resolution]('created_at')).values(
+        'start', 'choice_id').annotate(count=Count('pk')).order_by(
+        'start', 'choice_id')
+
+
+def is_rolled_up(question):
+    """Return True when the stored buckets of a question are current.
+
+    The buckets of an archived question are final, its votes are gone.
+    """
+    if question.archived_at is not None:
+        return True
+    return (question.timeline_rolled_up_at is not None
+            and question.timeline_rolled_up_at >= question.last_modified)
+
+
+def get_buckets(question, resolution, since=None, until=None):
+    """Return the buckets of a question, stored or counted.
+
+    Args:
+        question: the question.
+        resolution: ``minute`` or ``hour``.
+        since: only buckets starting at or after it.
+        until: only buckets starting before it.
+
+    Returns:
+        list[tuple]: (start, choice id, count) ordered by start.
+    """
+    if is_rolled_up(question):
+        buckets = VoteBucket.objects.filter(
+            question=question, resolution=resolution).order_by(
+            'start', 'choice_id').values('start', 'choice_id', 'count')
+    else:
+        buckets = count_votes(question, resolution)
+    if since is not None:
+        buckets = buckets.filter(start__gte=since)
+    if until is not None:
+        buckets = buckets.filter(start__lt=until)
+    return [(bucket['start'], bucket['choice_id'], bucket['count'])
+            for bucket in buckets]
+
+
+def rollup(question):
+    """Store the minute and hour buckets of a closed question.
+
+    Returns:
+        int: the amount of buckets stored.
+    """
+    # taken first, a vote changed meanwhile makes the rollup stale
+    now = timezone.now()
+    with transaction.atomic():
+        VoteBucket.objects.filter(question=question).delete()
+        buckets = [
+            VoteBucket(question=question, choice_id=bucket['choice_id'],
+                       resolution=resolution, start=bucket['start'],
+                       count=bucket['count'])
+            for resolution in TRUNCATE
+            for bucket in count_votes(question, resolution).iterator()]
+        VoteBucket.objects.bulk_create(buckets, batch_size=1000)
+        Question.objects.filter(pk=question.pk).update(
+            timeline_rolled_up_at=now)
+    question.timeline_rolled_up_at = now
+    return len(buckets)
+
+
+def pending_rollups():
+    """Return the closed questions whose stored buckets are not current."""
+    return Question.objects.closed().filter(archived_at__isnull=True).filter(
+        Q(timeline_rolled_up_at__isnull=True)
+        | Q(timeline_rolled_up_at__lt=F('last_modified')))
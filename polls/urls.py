@@ -1,12 +1,27 @@
 """routes to urls."""
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views
+
+if settings.POLLS_ASYNC_VIEWS:
+    views = async_views
+else:
+    from . import views
 
 app_name = 'polls'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
     path('<int:pk>/', views.DetailView.as_view(), name='detail'),
     path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+    # needs the ASGI server to share one hub between viewers, 204 under WSGI
+    path('<int:pk>/results/stream/', async_views.results_stream,
+         name='results_stream'),
     path('<int:question_id>/vote/', views.vote, name='vote'),
+    path('api/questions/<int:pk>/results', api.QuestionResultsAPI.as_view(),
+         name='api_results'),
+    path('api/results', api.BatchResultsAPI.as_view(),
+         name='api_batch_results'),
+    path('api/questions/<int:pk>/timeline', api.QuestionTimelineAPI.as_view(),
+         name='api_timeline'),
 ]
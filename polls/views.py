@@ -1,24 +1,46 @@
 """All views of polls for polls app."""
+import datetime
+import hashlib
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db.models import Q
 from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from django.shortcuts import render, redirect
 from django.views import generic
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from . import index_cache, ingest, results_cache, routers, stats
+from .ratelimit import get_client_ip, rate_limit  # noqa: F401
 from .models import Choice, Question, Vote
 import logging
 logger = logging.getLogger("polls")
 
 
-def get_client_ip(request):
-    """Get the visitor’s IP address using request headers."""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+def has_session(request):
+    """Return True when the request carries a session cookie.
+
+    Pages that only show whether the visitor is logged in check this
+    instead of loading the session and the user, logging out removes the
+    cookie.
+    """
+    return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def voting_closed(request, question):
+    """Return the redirect to the results of a question closed to votes.
+
+    Returns:
+        HttpResponseRedirect or None: None when the question can be voted.
+    """
+    if question.can_vote():
+        return None
+    messages.error(request, f'You are not allow to vote on question "'
+                            f'{question.question_text}"')
+    return redirect("polls:results", pk=question.pk)
 
 
 def get_queryset(self):
@@ -28,16 +50,178 @@ def get_queryset(self):
     ).order_by('-pub_date')[:5]
 
 
-class IndexView(generic.ListView):
-    """The view of index page which shows the list of all questions."""
+class ConditionalGetMixin:
+    """
+    Answer a GET with 304 Not Modified when the ETag or Last-Modified
+    validators still match, before any template is rendered.
+    """
+
+    # set to False by the view when its response must not be revalidated
+    cacheable = True
+
+    def get_validators(self):
+        """Return the ETag value and the last modified datetime."""
+        raise NotImplementedError
+
+    def not_modified(self, request, etag, last_modified):
+        """Return a 304 response when the validators match, else None."""
+        # pending messages are shown once, never answer them with 304
+        if request.COOKIES.get(CookieStorage.cookie_name):
+            self.cacheable = False
+        if not self.cacheable:
+            return None
+        return get_conditional_response(
+            request, etag=quote_etag(etag),
+            last_modified=self.timestamp(last_modified))
+
+    def add_validators(self, response, etag, last_modified):
+        """Set the ETag and Last-Modified headers on a cacheable response."""
+        # the login link, pending messages and the replica stickiness come
+        # from cookies, the session is never loaded to add this header
+        patch_vary_headers(response, ['Cookie'])
+        if self.cacheable:
+            response.headers['ETag'] = quote_etag(etag)
+            if last_modified is not None:
+                response.headers['Last-Modified'] = \
+                    http_date(self.timestamp(last_modified))
+        return response
+
+    @staticmethod
+    def timestamp(last_modified):
+        """Return the datetime as whole seconds, as HTTP dates have."""
+        return int(last_modified.timestamp()) if last_modified else None
+
+    def get(self, request, *args, **kwargs):
+        """Return 304 when the client copy is current, else render."""
+        validators = self.get_validators()
+        response = self.not_modified(request, *validators)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.add_validators(response, *validators)
+
+
+class ReplicaReadMixin:
+    """
+    Read the polls of a read-only view from the replica, unless the user
+    voted a moment ago and must see the vote.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        """Run the view with the polls reads routed to the replica."""
+        enabled = not routers.is_sticky(request)
+        parent = super().dispatch
+        if self.view_is_async:
+            async def dispatch():
+                with routers.replica_reads(enabled):
+                    return await parent(request, *args, **kwargs)
+            return dispatch()
+        with routers.replica_reads(enabled):
+            return parent(request, *args, **kwargs)
+
+
+def encode_cursor(question):
+    """Return the cursor of the page that starts after the question."""
+    micros = int(question.pub_date.timestamp() * 1_000_000)
+    return f"{micros}_{question.pk}"
+
+
+def decode_cursor(cursor):
+    """Return the (pub_date, id) of a cursor made by ``encode_cursor()``."""
+    try:
+        micros, pk = (int(part) for part in cursor.split('_'))
+        pub_date = datetime.datetime.fromtimestamp(micros / 1_000_000,
+                                                   tz=datetime.timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise Http404("Invalid page cursor")
+    return pub_date, pk
+
+
+class IndexView(ReplicaReadMixin, ConditionalGetMixin, generic.ListView):
+    """
+    The view of index page which shows the list of questions, newest first,
+    one keyset page at a time.
+
+    The query string may choose ``status`` (published, open, closed or
+    upcoming), ``size`` of the page and the ``after`` cursor of the page.
+    """
 
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
+    page_size = 5
+
+    def get_validators(self):
+        """Build the validators from the cached version of the index."""
+        return self.build_validators(*index_cache.get_version())
+
+    def build_validators(self, version, changed):
+        """Return the validators of an ``index_cache.get_version()``.
+
+        The ETag also covers the login state, which the page shows, and
+        the query string.
+        """
+        if (changed is not None and routers.read_alias() is not None
+                and timezone.now() - changed < datetime.timedelta(
+                    seconds=routers.sticky_seconds())):
+            # the replica may not show the change yet
+            self.cacheable = False
+        key = "|".join(str(part) for part in (
+            version, has_session(self.request), self.request.GET.urlencode()))
+        return hashlib.sha1(key.encode()).hexdigest(), changed
+
+    def get_status(self):
+        """Return the status filter chosen by the query string."""
+        status = self.request.GET.get('status', 'published')
+        if status not in ('published', 'open', 'closed', 'upcoming'):
+            raise Http404("Unknown poll status")
+        return status
+
+    def get_page_size(self):
+        """Return the page size of the query string, capped by settings."""
+        limit = getattr(settings, 'POLLS_INDEX_MAX_PAGE_SIZE', 50)
+        try:
+            size = int(self.request.GET.get('size', self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, limit))
 
     def get_queryset(self):
-        """Return the last five published questions."""
-        return Question.objects.filter(pub_date__lte=timezone.localtime()
-                                       ).order_by('-pub_date')[:5]
+        """
+        Return one page of questions ordered by (pub_date, id), newest
+        first, with one extra question to know if a next page exists.
+        """
+        return list(self.get_page_queryset())
+
+    def get_page_queryset(self):
+        """
+        Return the unevaluated query of the page.
+
+        The page starts after the cursor, so any page costs the same as
+        the first one.
+        """
+        questions = Question.objects.all()
+        cursor = self.request.GET.get('after')
+        if cursor:
+            pub_date, pk = decode_cursor(cursor)
+            # the cursor bound comes first, SQLite seeks the index with it
+            questions = questions.filter(
+                Q(pub_date__lt=pub_date) | Q(pk__lt=pk),
+                pub_date__lte=pub_date)
+        questions = questions.status(self.get_status()).order_by(
+            '-pub_date', '-pk')
+        return questions[:self.get_page_size() + 1]
+
+    def get_context_data(self, **kwargs):
+        """Cut the extra question off and add the cursor of the next page."""
+        page = self.object_list[:self.get_page_size()]
+        kwargs['object_list'] = page
+        context = super().get_context_data(**kwargs)
+        context['status'] = self.get_status()
+        context['page_size'] = self.get_page_size()
+        # the session is never read for the login link
+        context['logged_in'] = has_session(self.request)
+        if len(self.object_list) > len(page):
+            context['next_cursor'] = encode_cursor(page[-1])
+        return context
 
 
 class DetailView(LoginRequiredMixin, generic.DetailView):
@@ -46,18 +230,16 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
     model = Question
     template_name = 'polls/detail.html'
 
+    def get_queryset(self):
+        """Load the choices together with a published question."""
+        return Question.objects.published().prefetch_related('choice_set')
+
     def get_context_data(self, **kwargs):
-        question = Question.objects.get(pk=self.question_id)
+        """Add the id of the choice the user already voted for."""
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        if user.is_authenticated:
-            try:
-                selected_choice = Vote.objects.get(
-                    user=user, choice__in=question.choice_set.all()
-                ).choice.choice_text
-                context["selected_choice"] = selected_choice
-            except Vote.DoesNotExist:
-                pass
+        context["selected_choice_id"] = Vote.objects.filter(
+            user=self.request.user, question=self.object
+        ).values_list('choice_id', flat=True).first()
         return context
 
     def get(self, request, *args, **kwargs):
@@ -65,20 +247,17 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
         Send the error message for poll that is not allow for voting,
         but if the poll is allowed for voting, it will send to vote normally.
         """
-        self.question_id = kwargs["pk"]
-        self.object = Question.objects.get(pk=self.question_id)
-        if not self.object.is_published():
-            raise Http404("You are not allow to vote on this question")
-        if not self.object.can_vote():
-            messages.error(request,
-                           f'You are not allow to vote on question "'
-                           f'{self.object.question_text}"')
-            return redirect("polls:results", pk=self.question_id)
+        # a question that is not published is not found
+        self.object = self.get_object()
+        closed = voting_closed(request, self.object)
+        if closed is not None:
+            return closed
         context = self.get_context_data(object=self.object)
         return self.render_to_response(context)
 
 
-class ResultsView(generic.DetailView):
+class ResultsView(ReplicaReadMixin, ConditionalGetMixin,
+                  generic.DetailView):
     """
     The view of result page which shows the result that count
     each vote for each choice.
@@ -87,7 +266,50 @@ class ResultsView(generic.DetailView):
     model = Question
     template_name = 'polls/results.html'
 
+    def get_queryset(self):
+        """Load the precomputed statistics together with the question."""
+        return Question.objects.select_related('stats__leading_choice')
+
+    def get_object(self, queryset=None):
+        """Load the question once for both the validators and the page."""
+        if not hasattr(self, 'object'):
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_stats(self):
+        """Return the statistics of the question, None if not computed yet."""
+        return getattr(self.get_object(), 'stats', None)
+
+    def get_validators(self):
+        """
+        Build the validators from ``last_modified`` of the question and
+        the time its statistics were refreshed.
+        """
+        last_modified = self.get_object().last_modified
+        etag = f"{self.object.pk}-{last_modified.timestamp()}"
+        stats = self.get_stats()
+        if stats is not None:
+            etag += f"-{stats.refreshed_at.timestamp()}"
+            last_modified = max(last_modified, stats.refreshed_at)
+        return etag, last_modified
 
+    def get_context_data(self, **kwargs):
+        """Add the tally of every choice, from the results cache."""
+        context = super().get_context_data(**kwargs)
+        choice_list = getattr(self, 'choice_list', None)
+        if choice_list is None:
+            choice_list = results_cache.get_tally(self.object)
+        # a stale tally must not be stored under the current validators
+        self.cacheable = not choice_list.stale
+        context['choice_list'] = choice_list
+        context['total_votes'] = sum(c.num_votes for c in choice_list)
+        context['stats'] = self.get_stats()
+        # only the ASGI server keeps the live results stream open
+        context['live_results'] = settings.POLLS_ASYNC_VIEWS
+        return context
+
+
+@rate_limit('vote')
 @login_required
 def vote(request, question_id):
     """
@@ -95,28 +317,39 @@ def vote(request, question_id):
     returns to the results page if successful.
     """
     try:
-        question = Question.objects.get(pk=question_id)
-    except Question.DoesNotExist:
-        raise Http404("Question does not exist")
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST["choice"])
-    except (KeyError, Choice.DoesNotExist):
+        selected_choice = Choice.objects.select_related('question').get(
+            pk=request.POST["choice"], question_id=question_id)
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        try:
+            question = Question.objects.get(pk=question_id)
+        except Question.DoesNotExist:
+            raise Http404("Question does not exist")
         # Redisplay the question voting form.
         return render(request, 'polls/detail.html', {
                 'question': question,
                 'error_message': "You didn't select a choice.",
             })
-    user = request.user
-    try:
-        vote_object = Vote.objects.get(user=user,
-                                       choice__in=question.choice_set.all())
-    except Vote.DoesNotExist:
-        vote_object = Vote.objects.create(choice=selected_choice,
-                                          user=user)
-        vote_object.save()
-    vote_object.choice = selected_choice
-    vote_object.save()
+    # an archived or ended poll keeps its final tally
+    closed = voting_closed(request, selected_choice.question)
+    if closed is not None:
+        return closed
+    if ingest.is_queued():
+        # write-behind mode, process_votes writes the vote later
+        ingest.get_queue().enqueue(request.user.pk,
+                                   selected_choice.question_id,
+                                   selected_choice.pk)
+        messages.info(request, "Your vote was received and will be counted "
+                               "shortly.")
+        return routers.stick_to_primary(
+            redirect("polls:results", pk=question_id))
+    # one upsert on (user, question), update_or_create() runs in its own
+    # transaction.atomic() and the counters change in the same transaction
+    Vote.objects.update_or_create(
+        user=request.user, question=selected_choice.question,
+        defaults={'choice': selected_choice})
+    if stats.on_vote():
+        stats.refresh([selected_choice.question])
     # Always return an HttpResponseRedirect after successfully dealing
     # with POST data. This prevents data from being posted twice if a
     # user hits the Back button.
-    return redirect("polls:results", pk=question_id)
+    return routers.stick_to_primary(redirect("polls:results", pk=question_id))